@@ -1,17 +1,52 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from faster_whisper import WhisperModel
-import tempfile
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from starlette.background import BackgroundTask
+from faster_whisper import WhisperModel, decode_audio
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import io
+import json
+import hashlib
+import queue
+import threading
 import os
 import logging
+import sys
 import time
 
+# transcript_cache and metrics are shared with the solver; they live at the repo root
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from transcript_cache import transcript_cache, make_key
+from chunker import SAMPLE_RATE, split_on_silence, stitch
+import metrics
+from metrics import Counter, Histogram, span
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Audio Transcription API")
 
+# Concurrency settings
+CPU_CORES = os.cpu_count() or 1
+WHISPER_WORKERS = max(1, min(4, CPU_CORES // 2))         # model instances transcribing at once
+WHISPER_THREADS = max(1, CPU_CORES // WHISPER_WORKERS)   # CPU threads per model instance
+MAX_QUEUED = 8                                           # requests waiting for a free model
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024                      # matches the Node client's maxBodyLength
+UPLOAD_CHUNK = 256 * 1024
+MODEL_NAME = os.environ.get("WHISPER_MODEL", "base")   # set the same value for the solver to share cached transcripts
+BEAM_SIZE = 5
+LONG_MEDIA_SECONDS = 90    # longer audio is split at silences and transcribed in parallel
+CHUNK_SECONDS = 30
+
+# Metrics (stage latencies come from metrics.span)
+transcriptions_total = Counter("transcriptions_total", "Transcription requests, by endpoint and outcome.", labels=("endpoint", "status"))
+rejected_total = Counter("transcriptions_rejected_total", "Requests refused by back-pressure or size limits.", labels=("reason",))
+audio_seconds = Counter("audio_seconds_total", "Seconds of audio transcribed.")
+queue_wait = Histogram("whisper_queue_wait_seconds", "Time a chunk waited for a free model.")
+
 # Enable CORS
 app.add_middleware(
     CORSMiddleware,
@@ -21,27 +56,140 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load Whisper model on startup
+# Whisper model pool (loaded on startup). Transcription runs on a dedicated
+# executor so the event loop - and /health - stays responsive.
+model_pool = queue.Queue()
 whisper_model = None
+executor = ThreadPoolExecutor(max_workers=WHISPER_WORKERS, thread_name_prefix="whisper")
+state_lock = threading.Lock()
+pending_requests = 0   # queued + running
+busy_workers = 0
 
 @app.on_event("startup")
 async def load_model():
     global whisper_model
     try:
-        logger.info("Loading Whisper Base model...")
-        whisper_model = WhisperModel("base", device="cpu", compute_type="int8")
+        logger.info(f"Loading {WHISPER_WORKERS} Whisper Base model(s), {WHISPER_THREADS} threads each...")
+        for _ in range(WHISPER_WORKERS):
+            model = WhisperModel(MODEL_NAME, device="cpu", compute_type="int8", cpu_threads=WHISPER_THREADS)
+            model_pool.put(model)
+        whisper_model = model
         logger.info("Whisper model loaded successfully!")
     except Exception as e:
         logger.error(f"Failed to load Whisper model: {e}")
         raise
 
+@app.on_event("shutdown")
+def shutdown_executor():
+    executor.shutdown(wait=False, cancel_futures=True)
+
 @app.get("/health")
 async def health_check():
+    with state_lock:
+        pending, busy = pending_requests, busy_workers
     return {
         "status": "healthy",
-        "model_loaded": whisper_model is not None
+        "model_loaded": whisper_model is not None,
+        "workers": WHISPER_WORKERS,
+        "busy_workers": busy,
+        "utilisation": busy / WHISPER_WORKERS,
+        "queue_depth": max(0, pending - busy),
+        "max_queued": MAX_QUEUED,
+        "cache": transcript_cache.stats()
     }
 
+def admit_request(filename):
+    """Back-pressure: refuse rather than queue without bound."""
+    global pending_requests
+    with state_lock:
+        if pending_requests >= WHISPER_WORKERS + MAX_QUEUED:
+            logger.warning(f"Transcription queue full ({pending_requests} pending), rejecting {filename}")
+            rejected_total.inc(reason="queue_full")
+            raise HTTPException(status_code=429, detail="Transcription queue full, retry later")
+        pending_requests += 1
+
+def release_request():
+    global pending_requests
+    with state_lock:
+        pending_requests -= 1
+
+def release_once():
+    """A release_request() that is safe to call from several cleanup paths."""
+    released = threading.Event()
+    def release():
+        with state_lock:
+            if released.is_set():
+                return
+            released.set()
+        release_request()
+    return release
+
+async def read_upload(file):
+    """Reads the upload in chunks into one in-memory buffer, enforcing the size cap."""
+    audio_buffer = io.BytesIO()
+    digest = hashlib.sha256()
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK)
+        if not chunk:
+            break
+        if audio_buffer.tell() + len(chunk) > MAX_UPLOAD_BYTES:
+            rejected_total.inc(reason="too_large")
+            raise HTTPException(status_code=413, detail=f"File larger than {MAX_UPLOAD_BYTES} bytes")
+        audio_buffer.write(chunk)
+        digest.update(chunk)
+    size = audio_buffer.tell()
+    audio_buffer.seek(0)
+    return audio_buffer, digest.hexdigest(), size
+
+def decode_upload(audio_buffer):
+    """Blocking: decodes from memory straight to the 16 kHz float32 array Whisper takes."""
+    try:
+        with span("decode"):
+            return decode_audio(audio_buffer, sampling_rate=SAMPLE_RATE)
+    finally:
+        audio_buffer.close()
+
+def transcribe_array(audio, offset=0.0):
+    """Blocking: checks a model out of the pool and transcribes (runs on the executor)."""
+    global busy_workers
+    waited = time.time()
+    model = model_pool.get()
+    queue_wait.observe(time.time() - waited)
+    with state_lock:
+        busy_workers += 1
+    try:
+        with span("transcribe", seconds=round(len(audio) / SAMPLE_RATE, 1)):
+            segments, info = model.transcribe(audio, beam_size=BEAM_SIZE)
+            # segments is lazy; the actual decoding happens while iterating
+            segments = [{"start": seg.start + offset, "end": seg.end + offset, "text": seg.text} for seg in segments]
+        audio_seconds.inc(len(audio) / SAMPLE_RATE)
+        return segments, info
+    finally:
+        with state_lock:
+            busy_workers -= 1
+        model_pool.put(model)
+
+async def transcribe_parts(audio):
+    """
+    Yields (index, start, end, segments, info) per chunk as chunks finish.
+    Long media is split at silences and the chunks run in parallel across the
+    model pool; short media is a single chunk.
+    """
+    loop = asyncio.get_running_loop()
+    if len(audio) > LONG_MEDIA_SECONDS * SAMPLE_RATE:
+        with span("vad_split"):
+            ranges = await loop.run_in_executor(executor, split_on_silence, audio, CHUNK_SECONDS)
+        logger.info(f"Long media ({len(audio) / SAMPLE_RATE:.0f}s): {len(ranges)} chunks across {WHISPER_WORKERS} workers")
+    else:
+        ranges = [(0, len(audio))]
+
+    async def run_chunk(index, start, end):
+        segments, info = await loop.run_in_executor(executor, transcribe_array, audio[start:end], start / SAMPLE_RATE)
+        return index, start / SAMPLE_RATE, end / SAMPLE_RATE, segments, info
+
+    for next_done in asyncio.as_completed([run_chunk(i, a, b) for i, (a, b) in enumerate(ranges)]):
+        yield await next_done
+
 @app.post("/transcribe")
 async def transcribe_audio(file: UploadFile = File(...)):
     """Transcribe audio file to text using Whisper"""
@@ -49,49 +197,126 @@ async def transcribe_audio(file: UploadFile = File(...)):
     if not whisper_model:
         logger.error("Transcription request received but Whisper model not loaded!")
         raise HTTPException(status_code=503, detail="Whisper model not loaded")
-    
-    # Save uploaded file temporarily
-    temp_file = None
+
+    admit_request(file.filename)
+    status = "error"
     try:
-        # Create temp file with proper extension
-        suffix = os.path.splitext(file.filename)[1] or ".mp3"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_path = temp_file.name
-        
-        logger.info(f"Processing {file.filename} ({len(content)} bytes, temp: {temp_path})")
+        with span("read_upload"):
+            audio_buffer, audio_hash, size = await read_upload(file)
+        logger.info(f"Processing {file.filename} ({size} bytes, in memory)")
+
+        # Same audio + model + decoding params -> reuse the earlier transcript
+        cache_key = make_key(audio_hash, MODEL_NAME, beam_size=BEAM_SIZE, language=None)
+        cached = transcript_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"✓ Transcript cache hit for {file.filename}")
+            status = "cached"
+            return {"success": True, "transcription": cached["text"], "language": cached["language"],
+                    "duration": cached["duration"], "elapsed": 0.0, "cached": True}
         
         # Transcribe
         logger.info("Starting Whisper transcription...")
         start_time = time.time()
-        segments, info = whisper_model.transcribe(temp_path, beam_size=5)
-        text = " ".join([segment.text for segment in segments])
+        audio = await asyncio.get_running_loop().run_in_executor(executor, decode_upload, audio_buffer)
+        parts, language = {}, None
+        async for index, _, _, segments, info in transcribe_parts(audio):
+            parts[index] = segments
+            if index == 0: language = info.language
+        text, _ = stitch(parts)
+        duration = len(audio) / SAMPLE_RATE
         elapsed = time.time() - start_time
         
-        logger.info(f"✓ Transcription complete in {elapsed:.2f}s: '{text[:100]}...' (lang={info.language}, duration={info.duration:.1f}s)")
+        logger.info(f"✓ Transcription complete in {elapsed:.2f}s: '{text[:100]}...' (lang={language}, duration={duration:.1f}s, chunks={len(parts)})")
+        transcript_cache.put(cache_key, {"text": text, "language": language, "duration": duration})
+        metrics.stage_seconds.observe(elapsed, stage="request")
+        status = "ok"
         
         return {
             "success": True,
             "transcription": text,
-            "language": info.language,
-            "duration": info.duration,
-            "elapsed": elapsed
+            "language": language,
+            "duration": duration,
+            "elapsed": elapsed,
+            "chunks": len(parts)
         }
         
+    except HTTPException:
+        raise
+
     except Exception as e:
         logger.error(f"✗ Transcription failed for {file.filename}: {type(e).__name__}: {str(e)}")
         logger.exception("Full traceback:")
         raise HTTPException(status_code=500, detail=f"Transcription failed: {str(e)}")
     
     finally:
-        # Cleanup temp file
-        if temp_file and os.path.exists(temp_path):
-            try:
-                os.unlink(temp_path)
-                logger.debug(f"Cleaned up temp file: {temp_path}")
-            except Exception as cleanup_error:
-                logger.warning(f"Failed to cleanup {temp_path}: {cleanup_error}")
+        transcriptions_total.inc(endpoint="transcribe", status=status)
+        release_request()
+
+@app.post("/transcribe/stream")
+async def transcribe_audio_stream(file: UploadFile = File(...)):
+    """
+    Same as /transcribe, but streams newline-delimited JSON: one "partial"
+    record per chunk as soon as it is transcribed (chunks can finish out of
+    order; use "index" to place them), then one "final" record with the
+    stitched transcript.
+    """
+    if not whisper_model:
+        raise HTTPException(status_code=503, detail="Whisper model not loaded")
+
+    admit_request(file.filename)
+    try:
+        audio_buffer, audio_hash, size = await read_upload(file)
+    except BaseException:
+        release_request()
+        raise
+    logger.info(f"Streaming transcription of {file.filename} ({size} bytes, in memory)")
+    cache_key = make_key(audio_hash, MODEL_NAME, beam_size=BEAM_SIZE, language=None)
+    # The generator's finally never runs if the client leaves before streaming
+    # starts; the background task releases the slot in that case
+    release = release_once()
+
+    async def records():
+        status = "error"
+        try:
+            cached = transcript_cache.get(cache_key)
+            if cached is not None:
+                status = "cached"
+                yield json.dumps({"type": "final", "transcription": cached["text"], "language": cached["language"],
+                                  "duration": cached["duration"], "elapsed": 0.0, "cached": True}) + "\n"
+                return
+
+            start_time = time.time()
+            audio = await asyncio.get_running_loop().run_in_executor(executor, decode_upload, audio_buffer)
+            parts, language = {}, None
+            async for index, chunk_start, chunk_end, segments, info in transcribe_parts(audio):
+                parts[index] = segments
+                if index == 0: language = info.language
+                yield json.dumps({"type": "partial", "index": index, "start": chunk_start, "end": chunk_end,
+                                  "text": " ".join(seg["text"].strip() for seg in segments),
+                                  "segments": segments, "elapsed": time.time() - start_time}) + "\n"
+
+            text, segments = stitch(parts)
+            duration = len(audio) / SAMPLE_RATE
+            elapsed = time.time() - start_time
+            logger.info(f"✓ Streamed transcription complete in {elapsed:.2f}s ({len(parts)} chunks)")
+            metrics.stage_seconds.observe(elapsed, stage="request")
+            status = "ok"
+            transcript_cache.put(cache_key, {"text": text, "language": language, "duration": duration})
+            yield json.dumps({"type": "final", "transcription": text, "language": language, "duration": duration,
+                              "elapsed": elapsed, "chunks": len(parts), "segments": segments}) + "\n"
+        except Exception as e:
+            logger.error(f"✗ Streamed transcription failed for {file.filename}: {type(e).__name__}: {str(e)}")
+            yield json.dumps({"type": "error", "detail": f"Transcription failed: {str(e)}"}) + "\n"
+        finally:
+            transcriptions_total.inc(endpoint="transcribe_stream", status=status)
+            release()
+
+    return StreamingResponse(records(), media_type="application/x-ndjson", background=BackgroundTask(release))
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     import uvicorn
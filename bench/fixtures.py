@@ -0,0 +1,126 @@
+"""
+Deterministic assets for the benchmark quiz server, generated in memory
+with the standard library only (no binary files in the repo).
+"""
+import io
+import math
+import wave
+import zlib
+import struct
+import random
+import zipfile
+
+ROWS = 2000
+
+
+def csv_bytes(rows=ROWS, sep=","):
+    rng = random.Random(7)
+    cities = ["Paris", "Delhi", "Lagos", "Lima", "Oslo", "Osaka"]
+    lines = [sep.join(["id", "city", "value", "score"])]
+    for i in range(rows):
+        lines.append(sep.join([str(i), rng.choice(cities), str(rng.randint(1, 999)), f"{rng.random() * 100:.2f}"]))
+    return ("\n".join(lines) + "\n").encode()
+
+
+def json_bytes(rows=ROWS // 4):
+    rng = random.Random(11)
+    records = ",".join(f'{{"id": {i}, "amount": {rng.randint(1, 500)}, "ok": {str(i % 3 == 0).lower()}}}' for i in range(rows))
+    return f"[{records}]".encode()
+
+
+def pdf_bytes(pages=12, rows_per_page=30):
+    """A plain multi-page PDF: some prose plus an aligned numeric table on every page."""
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>")
+    page_ids = []
+    pages_id = len(objects) + 2 * pages + 1  # allocated after the page/content pairs
+    for page in range(pages):
+        lines = [f"Bench report page {page + 1}", "", "Region    Units    Revenue"]
+        for row in range(rows_per_page):
+            n = page * rows_per_page + row
+            lines.append(f"R{n:<8} {n * 3 % 97:<8} {n * 17 % 1000}")
+        text = "".join(f"({line}) Tj T* " for line in lines)
+        stream = f"BT /F1 10 Tf 12 TL 50 770 Td {text}ET".encode()
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] "
+                            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_id, font, content)))
+    kids = b" ".join(b"%d 0 R" % pid for pid in page_ids)
+    assert add(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)) == pages_id
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref))
+    return out.getvalue()
+
+
+def wav_bytes(seconds=4, rate=16000):
+    """A tone with a pause in the middle - enough to exercise decode + Whisper."""
+    frames = bytearray()
+    for i in range(seconds * rate):
+        t = i / rate
+        amplitude = 0 if seconds / 2 - 0.4 < t < seconds / 2 + 0.4 else 8000
+        frames += struct.pack("<h", int(amplitude * math.sin(2 * math.pi * 440 * t)))
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(bytes(frames))
+    return out.getvalue()
+
+
+def png_bytes(width=1600, height=1200, seed=0):
+    """An RGB gradient, large enough that the image stage has to downscale it."""
+    rows = bytearray()
+    for y in range(height):
+        rows.append(0)  # filter: none
+        for x in range(width):
+            rows += bytes((min(255, (x + seed) * 255 // width), y * 255 // height, (x + y) * 255 // (width + height)))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(bytes(rows), 6)) + chunk(b"IEND", b"")
+
+
+def zip_bytes():
+    inner = io.BytesIO()
+    with zipfile.ZipFile(inner, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("nested/notes.txt", "Nested archive notes.\n" * 50)
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("data/sales.csv", csv_bytes(rows=500))
+        z.writestr("docs/readme.md", "# Archive\nMembers of every kind.\n")
+        z.writestr("docs/report.pdf", pdf_bytes(pages=3, rows_per_page=10))
+        z.writestr("img/chart.png", png_bytes(400, 300, seed=3))
+        z.writestr("nested.zip", inner.getvalue())
+    return out.getvalue()
+
+
+def build_assets():
+    """name -> (content type, bytes). Built once per server."""
+    return {
+        "data.csv": ("text/csv", csv_bytes()),
+        "data.tsv": ("text/tab-separated-values", csv_bytes(sep="\t")),
+        "data.json": ("application/json", json_bytes()),
+        "report.pdf": ("application/pdf", pdf_bytes()),
+        "clip.wav": ("audio/wav", wav_bytes()),
+        "bundle.zip": ("application/zip", zip_bytes()),
+        "photo.png": ("image/png", png_bytes()),
+        "photo-small.png": ("image/png", png_bytes(800, 600)),  # near-duplicate, should be deduped
+    }
@@ -0,0 +1,211 @@
+"""
+Local stand-in for the quiz site and the chat-completions API.
+
+Serves chained questions of every kind the solver handles (plain HTML,
+CSV/TSV/JSON, PDF, audio, ZIP, images, pages full of links), checks
+submissions, and answers /v1/chat/completions like a model would - after a
+configurable delay - by reading the answer key printed on each question page.
+
+    python -m bench.quiz_server --port 8900 --llm-latency 0.8
+"""
+import re
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from bench.fixtures import build_assets
+
+KINDS = ("html", "csv", "tsv", "json", "pdf", "audio", "zip", "image", "links")
+RETRY_EVERY = 3   # every 3rd question rejects its first answer (with the next URL attached)
+
+QUESTION_PATH = re.compile(r"^/c/(\d+)/q/(\d+)$")
+ASSET_PATH = re.compile(r"^/c/(\d+)/a/([\w.-]+)$")
+SUB_PATH = re.compile(r"^/c/(\d+)/(sub|spa)/(\d+)$")
+SUBMIT_MARK = re.compile(r"BENCH SUBMIT (\S+)")
+ANSWER_MARK = re.compile(r"BENCH ANSWER (\S+)")
+
+PROSE = ("The quarterly figures below were collected from regional offices. "
+         "Read the attached material carefully and compute the requested value. ") * 4
+
+
+def expected_answer(chain, number):
+    return f"bench-{chain}-{number}"
+
+
+class QuizServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, questions=len(KINDS), llm_latency=0.5, llm_chunk_delay=0.02):
+        super().__init__(address, _Handler)
+        self.questions = questions
+        self.llm_latency = llm_latency
+        self.llm_chunk_delay = llm_chunk_delay
+        self.assets = build_assets()
+        self.counts = Counter()
+        self._attempts = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def chain_url(self, chain):
+        return f"{self.base_url}/c/{chain}/q/0"
+
+    def count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def attempt(self, chain, number):
+        with self._lock:
+            self._attempts[(chain, number)] += 1
+            return self._attempts[(chain, number)]
+
+    # --- PAGES ---
+    def question_page(self, chain, number):
+        kind = KINDS[number % len(KINDS)]
+        asset = f"/c/{chain}/a/"
+        body = {
+            "html": "<table><tr><th>Item</th><th>Qty</th></tr>" + "".join(
+                f"<tr><td>item{i}</td><td>{i * 7 % 13}</td></tr>" for i in range(40)) + "</table>",
+            "csv": f'<a href="{asset}data.csv">Download the CSV</a>',
+            "tsv": f'<a href="{asset}data.tsv">Download the TSV</a>',
+            "json": f'<a href="{asset}data.json">Download the JSON</a>',
+            "pdf": f'<a href="{asset}report.pdf">Read the report</a>',
+            "audio": f'<audio src="{asset}clip.wav"></audio>',
+            "zip": f'<a href="{asset}bundle.zip">Download the archive</a>',
+            "image": f'<img src="{asset}photo.png"><a href="{asset}photo-small.png">Thumbnail</a>',
+            "links": "".join(f'<a href="/c/{chain}/sub/{k}">Source {k}</a> ' for k in range(6))
+                     + "".join(f'<a href="/c/{chain}/spa/{k}">App {k}</a> ' for k in range(2)),
+        }[kind]
+        return (f"<html><body><h1>Question {number} ({kind})</h1><p>{PROSE}</p>{body}"
+                f"<p>Post your answer to {self.base_url}/submit.</p>"
+                f"<p>BENCH SUBMIT {self.base_url}/submit BENCH ANSWER {expected_answer(chain, number)}</p>"
+                f"</body></html>")
+
+    @staticmethod
+    def sub_page(kind, k):
+        if kind == "spa":
+            return ('<html><body><div id="root"></div><script>'
+                    f'document.getElementById("root").textContent = "Rendered source {k}. " + "{PROSE}";'
+                    '</script></body></html>')
+        return f"<html><body><h2>Source {k}</h2><p>{PROSE * 2}</p></body></html>"
+
+    # --- SUBMISSIONS ---
+    def submit(self, payload):
+        match = QUESTION_PATH.match(re.sub(r"^https?://[^/]+", "", payload.get("url", "")))
+        if not match:
+            return {"correct": False, "reason": "Unknown question URL"}
+        chain, number = int(match.group(1)), int(match.group(2))
+        attempt = self.attempt(chain, number)
+        next_url = f"{self.base_url}/c/{chain}/q/{number + 1}" if number + 1 < self.questions else None
+        if number % RETRY_EVERY == RETRY_EVERY - 1 and attempt == 1:
+            self.count("submit_rejected")
+            return {"correct": False, "reason": "Bench: first attempt is always rejected", "url": next_url}
+        if str(payload.get("answer")) != expected_answer(chain, number):
+            self.count("submit_wrong")
+            return {"correct": False, "reason": "Wrong answer", "url": next_url}
+        self.count("submit_correct")
+        return {"correct": True, "url": next_url}
+
+    # --- MOCK LLM ---
+    def completion_text(self, prompt):
+        submit_url = SUBMIT_MARK.search(prompt)
+        answer = ANSWER_MARK.search(prompt)
+        if "SINGLE Python expression" in prompt:
+            # Touches df so the sandbox does real work, but evaluates to the answer key
+            return f"{answer.group(1)!r} if len(df) >= 0 else None" if answer else "len(df)"
+        if not (submit_url and answer):
+            return "{}"
+        return json.dumps({"submit_url": submit_url.group(1), "answer": answer.group(1)})
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "BenchQuiz/1.0"
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+    def _send(self, status, body, content_type):
+        data = body.encode() if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        server = self.server
+        if match := QUESTION_PATH.match(self.path):
+            server.count("question_pages")
+            return self._send(200, server.question_page(int(match.group(1)), int(match.group(2))), "text/html; charset=utf-8")
+        if match := ASSET_PATH.match(self.path):
+            asset = server.assets.get(match.group(2))
+            if asset is None:
+                return self._send(404, "not found", "text/plain")
+            server.count("asset_downloads")
+            return self._send(200, asset[1], asset[0])
+        if match := SUB_PATH.match(self.path):
+            server.count(f"{match.group(2)}_pages")
+            return self._send(200, server.sub_page(match.group(2), match.group(3)), "text/html; charset=utf-8")
+        if self.path == "/stats":
+            return self._send(200, json.dumps(dict(server.counts)), "application/json")
+        self._send(404, "not found", "text/plain")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if self.path == "/submit":
+            return self._send(200, json.dumps(self.server.submit(payload)), "application/json")
+        if self.path.endswith("/chat/completions"):
+            return self._completion(payload)
+        self._send(404, "not found", "text/plain")
+
+    def _completion(self, payload):
+        server = self.server
+        server.count("llm_calls")
+        content = payload["messages"][0]["content"]
+        prompt = content if isinstance(content, str) else " ".join(p.get("text", "") for p in content)
+        text = server.completion_text(prompt)
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": max(1, len(text) // 4)}
+        time.sleep(server.llm_latency)
+
+        if not payload.get("stream"):
+            body = {"choices": [{"message": {"role": "assistant", "content": text}}], "usage": usage}
+            return self._send(200, json.dumps(body), "application/json")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        step = max(1, len(text) // 8)
+        try:
+            for i in range(0, len(text), step):
+                chunk = {"choices": [{"delta": {"content": text[i:i + step]}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(server.llm_chunk_delay)
+            self.wfile.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\ndata: [DONE]\n\n".encode())
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client stops reading once it has the fields it needs
+
+
+def start_server(port=0, **options):
+    """Starts the server on a background thread; returns it (see .base_url)."""
+    server = QuizServer(("127.0.0.1", port), **options)
+    threading.Thread(target=server.serve_forever, name="bench-quiz-server", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--questions", type=int, default=len(KINDS))
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds before the mock LLM's first token")
+    args = parser.parse_args()
+    server = QuizServer(("127.0.0.1", args.port), questions=args.questions, llm_latency=args.llm_latency)
+    print(f"Quiz server on {server.base_url}; chain 0 starts at {server.chain_url(0)}")
+    print(f"Point the solver at the mock LLM with AIPIPE_URL={server.base_url}/v1/chat/completions")
+    server.serve_forever()
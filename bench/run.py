@@ -0,0 +1,329 @@
+"""
+Offline end-to-end benchmark.
+
+Starts the local quiz server + mock LLM (bench.quiz_server), runs N chains
+concurrently and reports per-stage latency (from the stage_duration_seconds
+histograms), end-to-end and per-question latency, peak RSS and throughput.
+Results are written to bench/results/<timestamp>.json for later comparison.
+
+    python -m bench.run --chains 4                          # run_quiz_chain in-process
+    python -m bench.run --mode api --app-url http://127.0.0.1:8000 --chains 4
+    python -m bench.run --replay payloads.jsonl             # /llm-quiz payloads, one per line
+    python -m bench.run --chains 4 --compare bench/results/baseline.json
+
+In api mode the app must already be running with
+AIPIPE_URL=<bench server>/v1/chat/completions (use --port to pin the server).
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import resource
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+SECRET = "123"
+EMAIL = "bench@example.com"
+POLL_INTERVAL = 0.5
+RUN_TIMEOUT = 900       # seconds before unfinished chains are given up on
+
+METRIC_LINE = re.compile(r'^stage_duration_seconds_(bucket|sum|count)\{stage="([^"]*)"(?:,le="([^"]*)")?\} (\S+)$')
+
+
+# --- METRICS ---
+def parse_stage_metrics(text):
+    """stage -> {"buckets": [(le, cumulative count)...], "sum": s, "count": n} from Prometheus text."""
+    stages = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if not match:
+            continue
+        series, stage, le, value = match.groups()
+        entry = stages.setdefault(stage, {"buckets": [], "sum": 0.0, "count": 0})
+        if series == "bucket":
+            entry["buckets"].append((float(le), float(value)))
+        else:
+            entry[series] = float(value)
+    return stages
+
+
+def stage_delta(before, after):
+    """Observations made between two snapshots."""
+    delta = {}
+    for stage, entry in after.items():
+        old = before.get(stage, {"buckets": [], "sum": 0.0, "count": 0})
+        old_buckets = dict(old["buckets"])
+        count = entry["count"] - old["count"]
+        if count <= 0:
+            continue
+        delta[stage] = {
+            "buckets": [(le, n - old_buckets.get(le, 0)) for le, n in entry["buckets"]],
+            "sum": entry["sum"] - old["sum"],
+            "count": count,
+        }
+    return delta
+
+
+def bucket_quantile(q, buckets, count):
+    """Prometheus-style quantile estimate: linear interpolation inside the bucket."""
+    rank = q * count
+    lower_bound, lower_count = 0.0, 0
+    for bound, cumulative in buckets:
+        if cumulative >= rank:
+            if bound == float("inf"):
+                return lower_bound
+            width = cumulative - lower_count
+            return lower_bound + (bound - lower_bound) * ((rank - lower_count) / width if width else 1)
+        lower_bound, lower_count = bound, cumulative
+    return lower_bound
+
+
+def summarize_stages(delta):
+    return {
+        stage: {
+            "count": int(entry["count"]),
+            "total": round(entry["sum"], 3),
+            "mean": round(entry["sum"] / entry["count"], 4),
+            "p50": round(bucket_quantile(0.5, entry["buckets"], entry["count"]), 4),
+            "p95": round(bucket_quantile(0.95, entry["buckets"], entry["count"]), 4),
+        }
+        for stage, entry in sorted(delta.items())
+    }
+
+
+def distribution(values):
+    if not values:
+        return None
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {"count": len(values), "mean": round(sum(values) / len(values), 3),
+            "p50": round(pick(0.5), 3), "p95": round(pick(0.95), 3), "max": round(values[-1], 3)}
+
+
+def peak_rss_mb(pid=None):
+    """Peak RSS of this process and its children, or of `pid` (VmHWM) in api mode."""
+    if pid:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return {"app": round(int(line.split()[1]) / 1024, 1)}
+        except OSError:
+            return None
+        return None
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KiB on Linux
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+# --- DRIVERS ---
+class DirectDriver:
+    """Runs chains in this process through a JobManager, like the app's worker pool."""
+
+    def __init__(self, workers):
+        sys.path.insert(0, ROOT)
+        import metrics
+        from job_manager import JobManager
+        self._metrics = metrics
+        self._jobs = JobManager(workers=workers, max_queued=10_000)
+
+    def metrics_text(self):
+        return self._metrics.render()
+
+    def start(self, payload):
+        return self._jobs.submit(payload["email"], payload["secret"], payload["url"])
+
+    def status(self, job):
+        return job.to_dict()
+
+    def close(self):
+        self._jobs.shutdown()
+
+
+class ApiDriver:
+    """Posts /llm-quiz to a running app and polls /jobs/{id}."""
+
+    def __init__(self, app_url):
+        import requests
+        self._session = requests.Session()
+        self._url = app_url.rstrip("/")
+
+    def metrics_text(self):
+        return self._session.get(f"{self._url}/metrics", timeout=10).text
+
+    def start(self, payload):
+        response = self._session.post(f"{self._url}/llm-quiz", json=payload, timeout=30)
+        response.raise_for_status()
+        return response.json()["job_id"]
+
+    def status(self, job_id):
+        return self._session.get(f"{self._url}/jobs/{job_id}", timeout=10).json()
+
+    def close(self):
+        self._session.close()
+
+
+def load_payloads(path):
+    payloads = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if "url" not in record:
+                continue  # not a quiz payload
+            payloads.append({"email": record.get("email", EMAIL), "secret": record.get("secret", SECRET), "url": record["url"]})
+    return payloads
+
+
+def run(driver, payloads, rss_pid=None, timeout=RUN_TIMEOUT):
+    before = parse_stage_metrics(driver.metrics_text())
+    started = time.time()
+    pending = {i: driver.start(payload) for i, payload in enumerate(payloads)}
+    finished = {}
+    while pending and time.time() - started < timeout:
+        time.sleep(POLL_INTERVAL)
+        for i, handle in list(pending.items()):
+            status = driver.status(handle)
+            if status["status"] in ("completed", "failed"):
+                finished[i] = status
+                del pending[i]
+    wall = time.time() - started
+    after = parse_stage_metrics(driver.metrics_text())
+    for i, handle in pending.items():
+        # Still running: reported as timed out with whatever questions it got through
+        finished[i] = {**driver.status(handle), "status": "timed_out", "error": f"not finished after {timeout}s"}
+
+    jobs = [finished[i] for i in sorted(finished)]
+    questions = [q for job in jobs for q in job["questions"]]
+    return {
+        "chains": len(jobs),
+        "chains_completed": sum(1 for job in jobs if job["status"] == "completed"),
+        "questions": len(questions),
+        "questions_correct": sum(1 for q in questions if q["status"] == "correct"),
+        "wall_seconds": round(wall, 3),
+        "throughput": {"questions_per_s": round(len(questions) / wall, 3), "chains_per_s": round(len(jobs) / wall, 4)},
+        "end_to_end": distribution([job["finished_at"] - job["started_at"] for job in jobs if job["started_at"]]),
+        "per_question": distribution([q["elapsed"] for q in questions]),
+        "stages": summarize_stages(stage_delta(before, after)),
+        "peak_rss_mb": peak_rss_mb(rss_pid),
+        "chains_timed_out": len(pending),
+        "errors": [job["error"] for job in jobs if job["error"]],
+    }
+
+
+# --- REPORTING ---
+COMPARED = [
+    ("wall_seconds", ("wall_seconds",)),
+    ("questions/s", ("throughput", "questions_per_s")),
+    ("end-to-end p50", ("end_to_end", "p50")),
+    ("end-to-end p95", ("end_to_end", "p95")),
+    ("question p50", ("per_question", "p50")),
+    ("question p95", ("per_question", "p95")),
+]
+
+
+def _lookup(result, path):
+    for key in path:
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def print_report(result):
+    print(f"\n{result['chains_completed']}/{result['chains']} chains completed, "
+          f"{result['questions_correct']}/{result['questions']} questions correct in {result['wall_seconds']}s "
+          f"({result['throughput']['questions_per_s']} questions/s)")
+    for label, key in (("End-to-end", "end_to_end"), ("Per question", "per_question")):
+        if result[key]:
+            print(f"{label:<14} " + "  ".join(f"{k}={v}" for k, v in result[key].items()))
+    print(f"Peak RSS (MB)  {result['peak_rss_mb']}")
+    print(f"\n{'stage':<28}{'count':>7}{'mean':>9}{'p50':>9}{'p95':>9}{'total':>10}")
+    for stage, s in result["stages"].items():
+        print(f"{stage:<28}{s['count']:>7}{s['mean']:>9}{s['p50']:>9}{s['p95']:>9}{s['total']:>10}")
+    for error in result["errors"]:
+        print(f"! {error}")
+
+
+def print_comparison(result, baseline):
+    print(f"\nvs {baseline.get('saved_as', 'baseline')}:")
+    rows = [(label, _lookup(baseline, path), _lookup(result, path)) for label, path in COMPARED]
+    rows += [(f"stage {stage} mean", _lookup(baseline, ("stages", stage, "mean")), s["mean"])
+             for stage, s in result["stages"].items()]
+    for label, old, new in rows:
+        if old is None or new is None:
+            continue
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"  {label:<34}{old:>10} -> {new:<10} {change}")
+
+
+def save(result):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + ".json")
+    result["saved_as"] = os.path.relpath(path, ROOT)
+    with open(path, "w") as f:
+        json.dump(result, f, indent=1)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chains", type=int, default=2, help="chains run concurrently")
+    parser.add_argument("--questions", type=int, default=9, help="questions per chain (one per page kind by default)")
+    parser.add_argument("--mode", choices=("direct", "api"), default="direct")
+    parser.add_argument("--app-url", default="http://127.0.0.1:8000", help="app to drive in api mode")
+    parser.add_argument("--app-pid", type=int, help="app process, for peak RSS in api mode")
+    parser.add_argument("--port", type=int, default=0, help="bench server port (0 = any free port)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds the mock LLM waits before answering")
+    parser.add_argument("--replay", help="JSONL file of /llm-quiz payloads to run instead of generated chains")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    parser.add_argument("--timeout", type=float, default=RUN_TIMEOUT, help="seconds to wait for all chains")
+    args = parser.parse_args()
+
+    from bench.quiz_server import start_server
+    server = start_server(port=args.port, questions=args.questions, llm_latency=args.llm_latency)
+    print(f"Bench server on {server.base_url}")
+
+    if args.replay:
+        payloads = load_payloads(args.replay)
+    else:
+        payloads = [{"email": EMAIL, "secret": SECRET, "url": server.chain_url(i)} for i in range(args.chains)]
+
+    if args.mode == "direct":
+        # Must be set before llm_client is imported
+        os.environ["AIPIPE_URL"] = f"{server.base_url}/v1/chat/completions"
+        os.environ.setdefault("TRACE_DIR", os.path.join(ROOT, "bench", "results", "traces"))
+        driver = DirectDriver(workers=args.chains)
+    else:
+        driver = ApiDriver(args.app_url)
+
+    try:
+        result = run(driver, payloads, rss_pid=args.app_pid if args.mode == "api" else None, timeout=args.timeout)
+    finally:
+        driver.close()
+        server.shutdown()
+
+    result.update({
+        "mode": args.mode,
+        "concurrency": args.chains,
+        "llm_latency": args.llm_latency,
+        "replay": args.replay,
+        "server": dict(server.counts),
+        "timestamp": time.time(),
+    })
+    print_report(result)
+    print(f"\nSaved {save(result)}")
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import re
+import asyncio
+import logging
+import threading
+import contextvars
+import concurrent.futures
+from contextlib import asynccontextmanager
+from lazy_loader import LazyComponent
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+MAX_CONTEXTS = 4   # questions scraping at the same time
+MAX_PAGES = 8      # tabs open across all contexts
+LAUNCH_TIMEOUT = 30000
+
+# Requests that never change a page's text: aborted in every context
+BLOCKED_RESOURCE_TYPES = ("font", "media")
+BLOCKED_HOSTS = re.compile(
+    r"(google-analytics|googletagmanager|doubleclick|googlesyndication|hotjar|segment\.(io|com)|"
+    r"mixpanel|amplitude|clarity\.ms|facebook\.net|connect\.facebook|plausible\.io|sentry\.io|newrelic|nr-data)",
+    re.I,
+)
+
+
+def _copy_result(task, future):
+    if task.cancelled():
+        future.set_exception(concurrent.futures.CancelledError())
+    elif task.exception() is not None:
+        future.set_exception(task.exception())
+    else:
+        future.set_result(task.result())
+
+
+class BrowserManager:
+    """
+    Keeps one Chromium alive for the whole process.
+
+    Playwright objects are bound to the event loop that created them, so the
+    browser lives on a dedicated background loop thread. Callers from the
+    (sync) FastAPI worker threads submit coroutines with `run()`, and each
+    question gets its own isolated BrowserContext via `new_context()`.
+    """
+
+    def __init__(self, max_contexts=MAX_CONTEXTS, max_pages=MAX_PAGES, headless=True):
+        self.max_contexts = max_contexts
+        self.max_pages = max_pages
+        self.headless = headless
+        self._loop = None
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._playwright = None
+        self._browser = None
+        self._launch_lock = None
+        self._context_slots = None
+        self._page_slots = None
+
+    # --- EVENT LOOP THREAD ---
+    def _ensure_loop(self):
+        with self._thread_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def _run():
+                    asyncio.set_event_loop(loop)
+                    self._launch_lock = asyncio.Lock()
+                    self._context_slots = asyncio.Semaphore(self.max_contexts)
+                    self._page_slots = asyncio.Semaphore(self.max_pages)
+                    ready.set()
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=_run, name="browser-loop", daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    def run(self, coro, timeout=None):
+        """
+        Runs a coroutine on the browser loop and blocks until it finishes.
+
+        The caller's contextvars (e.g. the question deadline) are carried over,
+        so they also reach any threads the coroutine starts with to_thread().
+        """
+        loop = self._ensure_loop()
+        ctx = contextvars.copy_context()
+        future = concurrent.futures.Future()
+
+        def _start():
+            if not future.set_running_or_notify_cancel():
+                coro.close()
+                return
+            # A task copies the context that is current when it is created
+            task = loop.create_task(coro)
+            task.add_done_callback(lambda t: _copy_result(t, future))
+
+        loop.call_soon_threadsafe(_start, context=ctx)
+        return future.result(timeout)
+
+    # --- BROWSER LIFECYCLE ---
+    async def get_browser(self):
+        if self._browser and self._browser.is_connected():
+            return self._browser
+
+        async with self._launch_lock:
+            # Another caller may have relaunched while we waited
+            if self._browser and self._browser.is_connected():
+                return self._browser
+
+            if self._browser is not None:
+                logger.warning("Chromium is not connected. Relaunching...")
+                self._browser = None
+
+            if self._playwright is None:
+                # Imported here so loading the app doesn't pay for Playwright
+                from playwright.async_api import async_playwright
+                self._playwright = await async_playwright().start()
+
+            logger.info("Launching Chromium...")
+            browser = await self._playwright.chromium.launch(headless=self.headless, timeout=LAUNCH_TIMEOUT)
+            browser.on("disconnected", self._on_disconnected)
+            self._browser = browser
+            logger.info("Chromium launched.")
+            return browser
+
+    def _on_disconnected(self, browser):
+        if self._browser is browser:
+            logger.warning("Chromium disconnected.")
+            self._browser = None
+
+    @staticmethod
+    async def _filter_request(route):
+        request = route.request
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or BLOCKED_HOSTS.search(request.url):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    @asynccontextmanager
+    async def new_context(self, block_resources=True, **kwargs):
+        """
+        Fresh, isolated BrowserContext (cookies, storage, cache) for one
+        question. Fonts, media and analytics are blocked unless
+        block_resources is False.
+        """
+        async with self._context_slots:
+            browser = await self.get_browser()
+            context = await browser.new_context(**kwargs)
+            if block_resources:
+                await context.route("**/*", self._filter_request)
+            try:
+                yield context
+            finally:
+                try:
+                    await context.close()
+                except Exception as e:
+                    logger.debug(f"Context close failed: {e}")
+
+    @asynccontextmanager
+    async def new_page(self, context):
+        async with self._page_slots:
+            page = await context.new_page()
+            try:
+                yield page
+            finally:
+                try:
+                    await page.close()
+                except Exception as e:
+                    logger.debug(f"Page close failed: {e}")
+
+    # --- SHUTDOWN ---
+    async def _shutdown(self):
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except Exception as e:
+                logger.warning(f"Error closing Chromium: {e}")
+            self._browser = None
+        if self._playwright is not None:
+            try:
+                await self._playwright.stop()
+            except Exception as e:
+                logger.warning(f"Error stopping Playwright: {e}")
+            self._playwright = None
+
+    def close(self):
+        with self._thread_lock:
+            loop, thread = self._loop, self._thread
+            self._loop, self._thread = None, None
+        if loop is None:
+            return
+        logger.info("Shutting down browser manager...")
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result(timeout=15)
+        except Exception as e:
+            logger.warning(f"Browser shutdown error: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        if not loop.is_running():
+            loop.close()
+
+
+browser_manager = BrowserManager()
+
+# Warm-up / readiness hook: launches Chromium ahead of the first question
+chromium = LazyComponent("chromium", lambda: browser_manager.run(browser_manager.get_browser()))
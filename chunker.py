@@ -0,0 +1,42 @@
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+SAMPLE_RATE = 16000
+
+
+def split_on_silence(audio, target_seconds=30, max_seconds=60, min_silence_ms=500):
+    """
+    Splits a 16 kHz sample array into contiguous (start, end) sample ranges of
+    roughly `target_seconds`, cutting in the middle of silences found by the
+    Silero VAD so no word is split. Stretches of continuous speech longer than
+    `max_seconds` are cut evenly as a last resort.
+    """
+    total = len(audio)
+    speech = get_speech_timestamps(audio, VadOptions(min_silence_duration_ms=min_silence_ms))
+
+    bounds = [0]
+    for prev, nxt in zip(speech, speech[1:]):
+        cut = (prev["end"] + nxt["start"]) // 2
+        if cut - bounds[-1] >= target_seconds * SAMPLE_RATE:
+            bounds.append(cut)
+    if total - bounds[-1] < target_seconds * SAMPLE_RATE / 4 and len(bounds) > 1:
+        bounds.pop()  # fold a short tail into the previous chunk
+    bounds.append(total)
+
+    ranges = []
+    max_len = max_seconds * SAMPLE_RATE
+    for start, end in zip(bounds, bounds[1:]):
+        pieces = max(1, -(-(end - start) // max_len))
+        step = -(-(end - start) // pieces)
+        for piece_start in range(start, end, step):
+            ranges.append((piece_start, min(end, piece_start + step)))
+    return ranges
+
+
+def stitch(parts):
+    """
+    Joins per-chunk results, given as {index: [segment, ...]} with segment
+    times already offset to the full file, into one ordered transcript.
+    """
+    segments = [seg for index in sorted(parts) for seg in parts[index]]
+    text = " ".join(seg["text"].strip() for seg in segments if seg["text"].strip())
+    return text, segments
@@ -0,0 +1,168 @@
+import re
+import math
+import logging
+from collections import Counter
+from functools import lru_cache
+from lazy_loader import LazyComponent
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+CONTEXT_TOKEN_BUDGET = 12000   # page context sent to the LLM per prompt
+HISTORY_TOKEN_BUDGET = 1500    # most recent failed attempts kept in the prompt
+MIN_SECTION_TOKENS = 200       # don't bother including a section cut shorter than this
+MAX_PINNED_SHARE = 0.5         # df schemas may take at most this share of the budget
+
+DF_MARKER = "Loaded into DataFrame 'df'"  # written before the schema of the one table that became df
+
+SECTION_HEADER = re.compile(r"^=== .* ===$", re.MULTILINE)
+WORD = re.compile(r"[a-z0-9_]{3,}")
+
+def _load_encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")  # gpt-4o family
+    except Exception as e:
+        logger.info(f"tiktoken not available ({e}), estimating tokens as chars/4.")
+        return None
+
+tokenizer = LazyComponent("tokenizer", _load_encoding)
+
+
+def count_tokens(text):
+    _encoding = tokenizer.get()
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def truncate_tokens(text, max_tokens):
+    if max_tokens <= 0:
+        return ""
+    _encoding = tokenizer.get()
+    if _encoding is not None:
+        tokens = _encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return _encoding.decode(tokens[:max_tokens]) + "\n[...truncated]\n"
+    if len(text) <= max_tokens * 4:
+        return text
+    return text[:max_tokens * 4] + "\n[...truncated]\n"
+
+
+def split_sections(page_context):
+    """Splits scrape output on its '=== ... ===' headers into ordered chunks."""
+    starts = [m.start() for m in SECTION_HEADER.finditer(page_context)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    bounds = starts + [len(page_context)]
+    return [page_context[a:b] for a, b in zip(bounds, bounds[1:]) if page_context[a:b].strip()]
+
+
+def dataframe_excerpt(section):
+    """The section's header line plus its df schema/sample part."""
+    at = section.find(DF_MARKER)
+    line_start = section.rfind("\n", 0, at) + 1
+    if line_start == 0:
+        return section
+    return section.split("\n", 1)[0] + "\n" + section[line_start:]
+
+
+def _bm25_scores(query_terms, documents, k1=1.5, b=0.75):
+    doc_terms = [Counter(WORD.findall(doc.lower())) for doc in documents]
+    lengths = [sum(t.values()) or 1 for t in doc_terms]
+    avg_len = sum(lengths) / len(lengths)
+    n = len(documents)
+    scores = []
+    for terms, length in zip(doc_terms, lengths):
+        score = 0.0
+        for term in query_terms:
+            tf = terms.get(term)
+            if not tf:
+                continue
+            df = sum(1 for t in doc_terms if term in t)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_len))
+        scores.append(score)
+    return scores
+
+
+@lru_cache(maxsize=32)
+def build_context(page_context, budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Packs the scraped page context under `budget` tokens.
+
+    The first section (the question page itself) is always kept. The other
+    sections - linked pages, transcripts, PDF/data/ZIP dumps - are ranked by
+    BM25 relevance to the question text and added best-first, the last one
+    trimmed to fit. A section that loaded `df` always keeps at least its
+    schema, which the code path needs, even when the question page alone
+    would fill the budget. Kept sections stay in their original order.
+    Results are cached, so retries of the same question reuse the assembled
+    prefix.
+    """
+    total = count_tokens(page_context)
+    if total <= budget:
+        return page_context
+
+    sections = split_sections(page_context)
+    question = sections[0]
+    others = sections[1:]
+
+    # Reserve the df schemas first; the question page gets what is left
+    chosen = {}
+    pinned_budget = int(budget * MAX_PINNED_SHARE)
+    for idx, section in enumerate(others):
+        if DF_MARKER in section:
+            chosen[idx] = truncate_tokens(dataframe_excerpt(section), pinned_budget)
+            pinned_budget = max(0, pinned_budget - count_tokens(chosen[idx]))
+    pinned_tokens = sum(count_tokens(text) for text in chosen.values())
+
+    question_tokens = count_tokens(question)
+    if question_tokens >= budget - pinned_tokens:
+        question = truncate_tokens(question, budget - pinned_tokens)
+        return question + "".join(chosen[i] for i in sorted(chosen))
+
+    query_terms = set(WORD.findall(question.lower()))
+    scores = _bm25_scores(query_terms, others) if others else []
+
+    remaining = budget - question_tokens - pinned_tokens
+    for idx in sorted(range(len(others)), key=lambda i: scores[i], reverse=True):
+        if remaining < MIN_SECTION_TOKENS:
+            break
+        tokens = count_tokens(others[idx])
+        if idx in chosen:
+            # Only the schema was pinned; take the whole section if it fits
+            extra = tokens - count_tokens(chosen[idx])
+            if extra <= remaining:
+                chosen[idx] = others[idx]
+                remaining -= extra
+            continue
+        if tokens <= remaining:
+            chosen[idx] = others[idx]
+            remaining -= tokens
+        else:
+            chosen[idx] = truncate_tokens(others[idx], remaining)
+            remaining = 0
+
+    packed = question + "".join(chosen[i] for i in sorted(chosen))
+    dropped = len(others) - len(chosen)
+    logger.info(f"📦 Context packed: {total} -> {budget - remaining} tokens ({dropped} sections dropped)")
+    return packed
+
+
+def trim_history(attempt_history, budget=HISTORY_TOKEN_BUDGET):
+    """Keeps the most recent attempts that fit in `budget` tokens."""
+    if count_tokens(attempt_history) <= budget:
+        return attempt_history
+    lines = attempt_history.strip().split("\n")
+    kept = []
+    used = 0
+    for line in reversed(lines):
+        tokens = count_tokens(line) + 1
+        if used + tokens > budget:
+            break
+        kept.append(line)
+        used += tokens
+    omitted = len(lines) - len(kept)
+    return f"\n[{omitted} earlier attempts omitted]\n" + "\n".join(reversed(kept))
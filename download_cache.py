@@ -0,0 +1,360 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import http_client
+from metrics import Counter, cache_requests
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+CACHE_DIR = "cache/downloads"
+MAX_MEMORY_BYTES = 256 * 1024 * 1024   # in-process LRU
+MAX_DISK_BYTES = 1024 * 1024 * 1024    # on-disk blob store
+DOWNLOAD_TIMEOUT = 30  # read timeout; connect timeout comes from http_client
+MAX_DOWNLOAD_BYTES = 200 * 1024 * 1024
+CHUNK_SIZE = 256 * 1024
+
+downloaded_bytes = Counter("downloaded_bytes_total", "Response bytes read by the download cache.")
+
+
+def _url_key(url):
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+
+class DownloadTooLarge(ValueError):
+    pass
+
+
+def _read_body(resp, max_bytes):
+    """Streams the response body in chunks, refusing anything over max_bytes."""
+    length = resp.headers.get("Content-Length")
+    if length and length.isdigit() and int(length) > max_bytes:
+        resp.close()
+        raise DownloadTooLarge(f"{resp.url} is {int(length)} bytes (limit {max_bytes})")
+
+    chunks = []
+    received = 0
+    try:
+        for chunk in resp.iter_content(CHUNK_SIZE):
+            received += len(chunk)
+            if received > max_bytes:
+                raise DownloadTooLarge(f"{resp.url} exceeds {max_bytes} bytes")
+            chunks.append(chunk)
+    finally:
+        resp.close()
+        downloaded_bytes.inc(received)
+    return b"".join(chunks)
+
+
+class DownloadCache:
+    """
+    Download layer shared by every extractor in utils.py.
+
+    Blobs are stored by SHA-256 of their content (so two URLs serving the same
+    file share one copy) and an index maps each URL to its blob plus the
+    ETag/Last-Modified validators. Within one process a URL is fetched at most
+    once; entries left on disk by an earlier process are revalidated with a
+    conditional GET before being reused.
+
+    `fetch()` returns the cached `bytes` object itself - callers wrap it in
+    `io.BytesIO`/`memoryview` instead of copying it.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_memory_bytes=MAX_MEMORY_BYTES, max_disk_bytes=MAX_DISK_BYTES):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._blob_dir = os.path.join(cache_dir, "blobs")
+        self._index_dir = os.path.join(cache_dir, "index")
+        os.makedirs(self._blob_dir, exist_ok=True)
+        os.makedirs(self._index_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()   # sha256 -> bytes
+        self._memory_bytes = 0
+        self._validated = {}           # url -> sha256, fetched/revalidated by this process
+        self._inflight = {}            # url -> threading.Event
+        self.hits = 0
+        self.misses = 0
+
+    # --- PUBLIC API ---
+    def fetch(self, url, max_bytes=MAX_DOWNLOAD_BYTES):
+        """Returns the body of `url` as bytes, downloading it only when needed."""
+        while True:
+            with self._lock:
+                digest = self._validated.get(url)
+                data = self._memory_get(digest) if digest is not None else None
+            if digest is not None and data is None:
+                # Read from disk outside the lock; other lookups shouldn't queue behind it
+                data = self._read_blob(digest)
+                with self._lock:
+                    if data is not None:
+                        self._memory_put(digest, data)
+                    elif self._validated.get(url) == digest:
+                        del self._validated[url]
+            if data is not None:
+                if len(data) > max_bytes:
+                    raise DownloadTooLarge(f"{url} is {len(data)} bytes (limit {max_bytes})")
+                with self._lock:
+                    self.hits += 1
+                cache_requests.inc(cache="download", result="hit")
+                return data
+
+            with self._lock:
+                if url in self._validated:
+                    continue  # downloaded by another thread meanwhile
+                # Collapse concurrent requests for the same URL into one download
+                waiter = self._inflight.get(url)
+                if waiter is None:
+                    self._inflight[url] = threading.Event()
+                    break
+            waiter.wait()
+
+        try:
+            data, digest = self._download(url, max_bytes)
+            with self._lock:
+                self._validated[url] = digest
+                self._memory_put(digest, data)
+            return data
+        finally:
+            with self._lock:
+                self._inflight.pop(url).set()
+
+    def fetch_file(self, url, max_bytes=MAX_DOWNLOAD_BYTES):
+        """
+        Like fetch(), but streams the body straight into the blob store and
+        returns the blob opened for reading, so large archives never sit in
+        memory. The caller closes the file.
+        """
+        with self._lock:
+            digest = self._validated.get(url)
+        if digest is not None:
+            f = self._open_blob(digest, url, max_bytes)
+            if f is not None:
+                with self._lock:
+                    self.hits += 1
+                    cache_requests.inc(cache="download", result="hit")
+                return f
+
+        entry = self._read_index(url)
+        headers = {}
+        if entry and self._blob_exists(entry["sha256"]):
+            if entry.get("etag"): headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"): headers["If-Modified-Since"] = entry["last_modified"]
+
+        resp = http_client.get(url, headers=headers, timeout=DOWNLOAD_TIMEOUT, stream=True)
+        if resp.status_code == 304 and headers:
+            resp.close()
+            f = self._open_blob(entry["sha256"], url, max_bytes)
+            if f is not None:
+                logger.info(f"♻️ Cache revalidated: {url}")
+                with self._lock:
+                    self.hits += 1
+                    cache_requests.inc(cache="download", result="hit")
+                    self._validated[url] = entry["sha256"]
+                return f
+            resp = http_client.get(url, timeout=DOWNLOAD_TIMEOUT, stream=True)
+
+        if not resp.ok:
+            resp.close()
+            resp.raise_for_status()
+        digest, size = self._spool_body(resp, max_bytes)
+        with self._lock:
+            self.misses += 1
+            cache_requests.inc(cache="download", result="miss")
+            self._validated[url] = digest
+        self._write_index(url, {
+            "url": url,
+            "sha256": digest,
+            "size": size,
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "content_type": resp.headers.get("Content-Type"),
+            "fetched_at": time.time(),
+        })
+        # Open before evicting so the blob can't disappear under us
+        f = open(self._blob_path(digest), "rb")
+        self._evict_disk()
+        return f
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_bytes": self._memory_bytes,
+                "memory_entries": len(self._memory),
+            }
+
+    # --- NETWORK ---
+    def _download(self, url, max_bytes):
+        entry = self._read_index(url)
+        headers = {}
+        if entry and self._blob_exists(entry["sha256"]):
+            if entry.get("etag"): headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"): headers["If-Modified-Since"] = entry["last_modified"]
+        else:
+            entry = None
+
+        resp = http_client.get(url, headers=headers, timeout=DOWNLOAD_TIMEOUT, stream=True)
+
+        if resp.status_code == 304 and entry:
+            data = self._read_blob(entry["sha256"])
+            resp.close()
+            if data is not None:
+                logger.info(f"♻️ Cache revalidated: {url}")
+                with self._lock:
+                    self.hits += 1
+                    cache_requests.inc(cache="download", result="hit")
+                return data, entry["sha256"]
+            # Blob vanished between the check and the read: fetch it for real
+            resp = http_client.get(url, timeout=DOWNLOAD_TIMEOUT, stream=True)
+
+        if not resp.ok:
+            resp.close()
+            resp.raise_for_status()
+        data = _read_body(resp, max_bytes)
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self.misses += 1
+            cache_requests.inc(cache="download", result="miss")
+
+        self._write_blob(digest, data)
+        self._write_index(url, {
+            "url": url,
+            "sha256": digest,
+            "size": len(data),
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "content_type": resp.headers.get("Content-Type"),
+            "fetched_at": time.time(),
+        })
+        self._evict_disk()
+        return data, digest
+
+    # --- MEMORY LRU (caller holds the lock) ---
+    def _memory_get(self, digest):
+        data = self._memory.get(digest)
+        if data is not None:
+            self._memory.move_to_end(digest)
+        return data
+
+    def _memory_put(self, digest, data):
+        if len(data) > self.max_memory_bytes or digest in self._memory:
+            return
+        self._memory[digest] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    # --- DISK STORE ---
+    def _blob_path(self, digest):
+        return os.path.join(self._blob_dir, digest)
+
+    def _blob_exists(self, digest):
+        return os.path.exists(self._blob_path(digest))
+
+    def _read_blob(self, digest):
+        path = self._blob_path(digest)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # mtime doubles as last-used time for eviction
+            return data
+        except OSError:
+            return None
+
+    def _open_blob(self, digest, url, max_bytes):
+        path = self._blob_path(digest)
+        try:
+            f = open(path, "rb")
+        except OSError:
+            return None
+        size = os.fstat(f.fileno()).st_size
+        if size > max_bytes:
+            f.close()
+            raise DownloadTooLarge(f"{url} is {size} bytes (limit {max_bytes})")
+        os.utime(path)
+        return f
+
+    def _spool_body(self, resp, max_bytes):
+        """Streams the response into a temp file in the blob dir, hashing as it goes."""
+        length = resp.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > max_bytes:
+            resp.close()
+            raise DownloadTooLarge(f"{resp.url} is {int(length)} bytes (limit {max_bytes})")
+
+        digest = hashlib.sha256()
+        received = 0
+        tmp_path = os.path.join(self._blob_dir, f"spool-{threading.get_ident()}-{time.time_ns()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in resp.iter_content(CHUNK_SIZE):
+                    received += len(chunk)
+                    if received > max_bytes:
+                        raise DownloadTooLarge(f"{resp.url} exceeds {max_bytes} bytes")
+                    digest.update(chunk)
+                    f.write(chunk)
+            os.replace(tmp_path, self._blob_path(digest.hexdigest()))
+        finally:
+            resp.close()
+            downloaded_bytes.inc(received)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return digest.hexdigest(), received
+
+    def _write_blob(self, digest, data):
+        path = self._blob_path(digest)
+        if os.path.exists(path) or len(data) > self.max_disk_bytes:
+            return
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write cache blob: {e}")
+
+    def _read_index(self, url):
+        try:
+            with open(os.path.join(self._index_dir, _url_key(url) + ".json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_index(self, url, entry):
+        path = os.path.join(self._index_dir, _url_key(url) + ".json")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write cache index: {e}")
+
+    def _evict_disk(self):
+        try:
+            blobs = [e for e in os.scandir(self._blob_dir) if e.is_file() and not e.name.endswith(".tmp")]
+        except OSError:
+            return
+        total = sum(e.stat().st_size for e in blobs)
+        if total <= self.max_disk_bytes:
+            return
+        # Oldest-used first; stale index entries are harmless (blob check fails -> refetch)
+        for blob in sorted(blobs, key=lambda e: e.stat().st_mtime):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                size = blob.stat().st_size
+                os.remove(blob.path)
+                total -= size
+            except OSError:
+                pass
+
+
+download_cache = DownloadCache()
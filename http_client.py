@@ -0,0 +1,125 @@
+import time
+import random
+import logging
+import contextvars
+from contextlib import contextmanager
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+POOL_HOSTS = 32          # per-host pools kept alive
+POOL_PER_HOST = 16       # keep-alive connections per host
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MIN_ATTEMPT_TIME = 1     # don't start an attempt with less than this left
+
+# Absolute time.time() by which the current question must be finished.
+# Set by solve_single_question; copied into worker threads and the browser loop.
+_deadline = contextvars.ContextVar("question_deadline", default=None)
+
+retries_total = Counter("http_retries_total", "Outbound requests retried after an error or retryable status.", labels=("method",))
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    pass
+
+
+@contextmanager
+def deadline(at):
+    """Bounds every request made inside the block (and its child threads) by `at`."""
+    token = _deadline.set(at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def time_left():
+    """Seconds left before the current deadline, or None when unbounded."""
+    at = _deadline.get()
+    if at is None:
+        return None
+    return at - time.time()
+
+
+def _build_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_PER_HOST, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+session = _build_session()
+
+
+def _clip_timeout(timeout, remaining):
+    connect, read = timeout if isinstance(timeout, tuple) else (CONNECT_TIMEOUT, timeout)
+    if remaining is None:
+        return (connect, read)
+    return (min(connect, remaining), min(read, remaining))
+
+
+def _backoff(attempt, retry_after=None):
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_CAP)
+        except ValueError:
+            pass
+    # Full jitter: spreads retries from parallel questions apart
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+def request(method, url, timeout=READ_TIMEOUT, retries=MAX_RETRIES, **kwargs):
+    """
+    Sends a request on the shared keep-alive session.
+
+    Connection errors, timeouts and RETRY_STATUSES are retried with jittered
+    exponential backoff, but only while the question deadline leaves room for
+    another attempt. The last response (even a failed one) is returned so
+    callers keep their own status handling.
+    """
+    attempt = 0
+    while True:
+        remaining = time_left()
+        if remaining is not None and remaining < MIN_ATTEMPT_TIME:
+            raise DeadlineExceeded(f"No time left for {method} {url}")
+
+        try:
+            resp = session.request(method, url, timeout=_clip_timeout(timeout, remaining), **kwargs)
+            if resp.status_code not in RETRY_STATUSES:
+                return resp
+            error = None
+            wait = _backoff(attempt, resp.headers.get("Retry-After"))
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            resp, error = None, e
+            wait = _backoff(attempt)
+
+        remaining = time_left()
+        out_of_time = remaining is not None and remaining < wait + MIN_ATTEMPT_TIME
+        if attempt >= retries or out_of_time:
+            if error is not None:
+                raise error
+            return resp
+
+        attempt += 1
+        retries_total.inc(method=method)
+        reason = error or f"HTTP {resp.status_code}"
+        if resp is not None: resp.close()
+        logger.warning(f"🔁 {method} {url} failed ({reason}). Retry {attempt}/{retries} in {wait:.1f}s")
+        time.sleep(wait)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
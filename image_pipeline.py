@@ -0,0 +1,129 @@
+import io
+import base64
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+from lazy_loader import LazyComponent
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+# gpt-4o "high" detail fits images in 2048x2048, then scales the short side
+# to 768px before tiling; anything larger is uploaded and thrown away.
+MAX_LONG_SIDE = 2048
+MAX_SHORT_SIDE = 768
+JPEG_QUALITY = 85
+DHASH_DISTANCE = 2        # bits that may differ between two "same" images (re-encodes, resizes)
+
+MAGIC = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+)
+
+ACCEPTED_MIMES = ("image/png", "image/jpeg", "image/gif", "image/webp")  # what the vision API takes as-is
+
+PreparedImage = namedtuple("PreparedImage", "data_url sha256 dhash size")
+
+
+def _load_pillow():
+    try:
+        from PIL import Image
+        return Image
+    except ImportError:
+        logger.info("Pillow not available, images are sent as downloaded.")
+        return None
+
+pillow = LazyComponent("pillow", _load_pillow)
+
+
+def sniff_mime(data):
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    for magic, mime in MAGIC:
+        if data.startswith(magic):
+            return mime
+    return "image/jpeg"
+
+
+def _target_size(width, height):
+    scale = min(1.0, MAX_LONG_SIDE / max(width, height), MAX_SHORT_SIDE / max(1, min(width, height)))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _dhash(img, Image):
+    """64-bit difference hash: survives re-encoding and resizing, unlike a byte hash."""
+    small = img.convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return bits
+
+
+def _encode(img, Image):
+    """PNG for flat-colour or transparent images (charts, screenshots), JPEG for photos."""
+    buffer = io.BytesIO()
+    if img.mode in ("RGBA", "LA", "P") or img.getcolors(256) is not None:
+        if img.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+            img = img.convert("RGBA")
+        img.save(buffer, format="PNG", optimize=True)
+        return buffer.getvalue(), "image/png"
+    img.convert("RGB").save(buffer, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    return buffer.getvalue(), "image/jpeg"
+
+
+def prepare_image(data):
+    """
+    Downscales `data` to what the vision model actually looks at and
+    re-encodes it compactly. Returns a PreparedImage whose data_url carries
+    the real MIME type. Without Pillow the bytes are passed through.
+    """
+    sha256 = hashlib.sha256(data).hexdigest()
+    Image = pillow.get_or_none()
+    if Image is None:
+        mime = sniff_mime(data)
+        return PreparedImage(f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}", sha256, None, len(data))
+
+    with Image.open(io.BytesIO(data)) as img:
+        img.seek(0)  # first frame of animated GIF/WebP
+        img.load()
+        fingerprint = _dhash(img, Image)
+        original_size = img.size
+        size = _target_size(*original_size)
+        if size != original_size:
+            img = img.resize(size, Image.LANCZOS)
+        encoded, mime = _encode(img, Image)
+
+    original_mime = sniff_mime(data)
+    if size == original_size and len(encoded) >= len(data) and original_mime in ACCEPTED_MIMES:
+        encoded, mime = data, original_mime  # already small and compact
+    logger.info(f"🖼️ Image {len(data)} -> {len(encoded)} bytes ({mime}, {size[0]}x{size[1]})")
+    return PreparedImage(f"data:{mime};base64,{base64.b64encode(encoded).decode('utf-8')}", sha256, fingerprint, len(encoded))
+
+
+class ImageDeduper:
+    """Drops images already seen, by exact content or by near-identical dHash."""
+
+    def __init__(self, max_distance=DHASH_DISTANCE):
+        self.max_distance = max_distance
+        self._hashes = set()
+        self._fingerprints = []
+        self._lock = threading.Lock()
+
+    def add(self, image):
+        """Returns True if `image` is new (and remembers it), False for a duplicate."""
+        with self._lock:
+            if image.sha256 in self._hashes:
+                return False
+            if image.dhash is not None:
+                for seen in self._fingerprints:
+                    if bin(seen ^ image.dhash).count("1") <= self.max_distance:
+                        return False
+                self._fingerprints.append(image.dhash)
+            self._hashes.add(image.sha256)
+            return True
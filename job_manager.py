@@ -0,0 +1,90 @@
+import time
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from quiz_state import QuizJob, set_current_job
+from utils import run_quiz_chain
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+MAX_CONCURRENT_JOBS = 4    # chains solved at the same time
+MAX_QUEUED_JOBS = 16       # accepted chains waiting for a worker
+MAX_FINISHED_JOBS = 100    # finished jobs kept for /jobs/{id}
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobManager:
+    """
+    Runs quiz chains on a bounded worker pool.
+
+    Each job executes in its own contextvars context holding its QuizJob, so
+    per-question state (DataFrame, page context, attempt history) never leaks
+    between chains running side by side.
+    """
+
+    def __init__(self, workers=MAX_CONCURRENT_JOBS, max_queued=MAX_QUEUED_JOBS):
+        self.workers = workers
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="quiz-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, email, secret, url):
+        job = QuizJob(email, secret, url)
+        with self._lock:
+            active = sum(1 for j in self._jobs.values() if j.status in ("queued", "running"))
+            if active >= self.workers + self.max_queued:
+                raise QueueFull(f"{active} jobs already queued or running")
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(contextvars.Context().run, self._run, job)
+        logger.info(f"📋 Job {job.id} queued ({active + 1} active)")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            statuses = [j.status for j in self._jobs.values()]
+        return {
+            "workers": self.workers,
+            "running": statuses.count("running"),
+            "queued": statuses.count("queued"),
+            "max_queued": self.max_queued,
+        }
+
+    def _run(self, job):
+        set_current_job(job)
+        job.status = "running"
+        job.started_at = time.time()
+        logger.info(f"▶️ Job {job.id} started: {job.start_url}")
+        try:
+            run_quiz_chain(job.email, job.secret, job.start_url)
+            job.status = "completed"
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            logger.info(f"⏹️ Job {job.id} {job.status} in {job.finished_at - job.started_at:.1f}s")
+
+    def _prune(self):
+        # Caller holds the lock; drop the oldest finished jobs beyond the cap
+        finished = [jid for jid, j in self._jobs.items() if j.status in ("completed", "failed")]
+        for jid in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[jid]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+job_manager = JobManager()
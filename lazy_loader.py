@@ -0,0 +1,75 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# name -> LazyComponent, in registration order
+components = {}
+
+
+class LazyComponent:
+    """
+    A heavy dependency or model that is loaded on first use instead of at
+    import time. Loading happens once, under a lock; callers that arrive while
+    it is loading wait for it. The outcome is kept for /ready.
+    """
+
+    def __init__(self, name, loader, warm=True):
+        self.name = name
+        self.warm = warm           # include in the background warm-up
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._value = None
+        self.status = "not_loaded"
+        self.error = None
+        self.load_time = None
+        components[name] = self
+
+    def get(self):
+        if self.status == "ready":
+            return self._value
+        with self._lock:
+            if self.status != "ready":
+                self.status = "loading"
+                started = time.time()
+                try:
+                    self._value = self._loader()
+                    self.status = "ready"
+                    self.error = None
+                    logger.info(f"✅ {self.name} loaded in {time.time() - started:.2f}s")
+                except Exception as e:
+                    self.status = "failed"
+                    self.error = str(e)
+                    logger.error(f"Failed to load {self.name}: {e}")
+                    raise
+                finally:
+                    self.load_time = time.time() - started
+        return self._value
+
+    def get_or_none(self):
+        try:
+            return self.get()
+        except Exception:
+            return None
+
+    def describe(self):
+        return {"status": self.status, "load_time": self.load_time, "error": self.error}
+
+
+def warm_up(names=None):
+    """Loads components one after another in a background thread."""
+    targets = [c for c in components.values() if (c.name in names if names else c.warm)]
+
+    def _run():
+        for component in targets:
+            component.get_or_none()
+        logger.info("🔥 Warm-up finished.")
+
+    thread = threading.Thread(target=_run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def readiness():
+    return {name: component.describe() for name, component in components.items()}
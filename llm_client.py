@@ -0,0 +1,340 @@
+import os
+import json
+import time
+import logging
+import socket
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import http_client
+from metrics import Counter, Histogram, span
+
+# --- CONFIGURATION ---
+AIPIPE_TOKEN = os.environ.get("AIPIPE_TOKEN", "apikey")
+AIPIPE_URL = os.environ.get("AIPIPE_URL", "https://aipipe.org/openrouter/v1/chat/completions")  # the bench points this at its mock
+DEFAULT_MODEL = "openai/gpt-4o-mini"
+LLM_TIMEOUT = 60
+RACE_MODELS = []  # e.g. ["openai/gpt-4o-mini", "google/gemini-2.0-flash-001"]; empty = no racing
+
+logger = logging.getLogger(__name__)
+
+# --- METRICS ---
+llm_requests = Counter("llm_requests_total", "LLM API calls, by model and outcome.", labels=("model", "status"))
+llm_tokens = Counter("llm_tokens_total", "Tokens reported by the LLM API.", labels=("model", "type"))
+llm_ttft = Histogram("llm_time_to_first_token_seconds", "Time to first streamed token.", labels=("model",))
+
+# Shared by speculative code/answer calls and model races
+_llm_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm")
+
+
+def submit(fn, *args, **kwargs):
+    """Runs fn on the LLM pool, carrying over the caller's contextvars (question deadline)."""
+    ctx = contextvars.copy_context()
+    return _llm_pool.submit(ctx.run, fn, *args, **kwargs)
+
+
+class RaceCancel(threading.Event):
+    """
+    Set when a race is decided. Setting it also aborts the streams attached
+    to it, so a losing model that hasn't sent a token yet releases its
+    connection and pool thread at once instead of after LLM_TIMEOUT.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._responses = []
+        self._responses_lock = threading.Lock()
+
+    def attach(self, resp):
+        with self._responses_lock:
+            self._responses.append(resp)
+        if self.is_set():
+            _abort(resp)
+
+    def set(self):
+        super().set()
+        with self._responses_lock:
+            responses, self._responses = self._responses, []
+        for resp in responses:
+            _abort(resp)
+
+
+def _abort(resp):
+    # close() alone doesn't wake a thread blocked reading the socket; shutdown() does
+    try:
+        resp.raw.connection.sock.shutdown(socket.SHUT_RDWR)
+    except Exception:
+        pass
+    try:
+        resp.close()
+    except Exception:
+        pass
+
+
+def _build_request(prompt_text, images_b64=None, model=DEFAULT_MODEL, stream=False):
+    headers = {
+        "Authorization": f"Bearer {AIPIPE_TOKEN}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "https://hf.space"
+    }
+
+    # Construct Content Payload
+    content_payload = [{"type": "text", "text": prompt_text}]
+
+    # Add Images if present
+    if images_b64:
+        for i, img_str in enumerate(images_b64):
+            if len(img_str) > 0:
+                # Prepared images are complete data URLs with their real MIME type
+                url = img_str if img_str.startswith("data:") else f"data:image/jpeg;base64,{img_str}"
+                content_payload.append({
+                    "type": "image_url",
+                    "image_url": {
+                        "url": url
+                    }
+                })
+
+    payload = {
+        "model": model,
+        "messages": [{"role": "user", "content": content_payload}]
+    }
+    if stream:
+        payload["stream"] = True
+    return headers, payload
+
+
+def _record_usage(model, usage):
+    if not usage:
+        return
+    for kind in ("prompt", "completion"):
+        tokens = usage.get(f"{kind}_tokens")
+        if tokens:
+            llm_tokens.inc(tokens, model=model, type=kind)
+
+
+def get_llm_response(prompt_text, images_b64=None, model=DEFAULT_MODEL):
+    """
+    Sends text AND a list of images to LLM.
+    """
+    headers, payload = _build_request(prompt_text, images_b64, model=model)
+
+    try:
+        with span("llm", model=model):
+            resp = http_client.post(AIPIPE_URL, headers=headers, json=payload, timeout=LLM_TIMEOUT)
+            resp.raise_for_status()
+            body = resp.json()
+        _record_usage(model, body.get("usage"))
+        llm_requests.inc(model=model, status="ok")
+        return body['choices'][0]['message']['content']
+    except Exception as e:
+        llm_requests.inc(model=model, status="error")
+        logger.error(f"LLM API Error: {e}")
+        return None
+
+
+class JSONFieldStream:
+    """
+    Incremental parser for a single top-level JSON object arriving in pieces.
+
+    Anything before the first '{' (e.g. a ```json fence) is ignored. Each
+    top-level field is decoded as soon as its value is complete, so callers
+    can act on the fields they need without waiting for the closing brace.
+    """
+
+    def __init__(self):
+        self.buf = ""
+        self.fields = {}
+        self.complete = False
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key_start = None
+        self._key = None
+        self._value_start = None
+        self._string_value = False
+
+    def feed(self, text):
+        self.buf += text
+        buf = self.buf
+        while self._pos < len(buf) and not self.complete:
+            c = buf[self._pos]
+            if not self._started:
+                if c == '{':
+                    self._started = True
+                    self._depth = 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        if self._key is None and self._key_start is not None:
+                            self._key = self._decode(self._key_start, self._pos + 1)
+                        elif self._string_value:
+                            self._close_value(self._pos + 1)
+            elif c == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    if self._key is None:
+                        self._key_start = self._pos
+                    elif self._value_start is not None:
+                        self._string_value = True
+            elif c == ':' and self._depth == 1 and self._key is not None and self._value_start is None:
+                self._value_start = self._pos + 1
+            elif c in '{[':
+                self._depth += 1
+            elif c in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._close_value(self._pos)
+                    self.complete = True
+            elif c == ',' and self._depth == 1:
+                self._close_value(self._pos)
+            self._pos += 1
+        return self.fields
+
+    def has(self, *names):
+        return all(name in self.fields for name in names)
+
+    def _decode(self, start, end):
+        try:
+            return json.loads(self.buf[start:end])
+        except ValueError:
+            return None
+
+    def _close_value(self, end):
+        if self._key is not None and self._value_start is not None:
+            raw = self.buf[self._value_start:end].strip()
+            if raw:
+                try:
+                    self.fields[self._key] = json.loads(raw)
+                except ValueError:
+                    pass
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+        self._string_value = False
+
+
+def _iter_sse_deltas(resp, usage=None):
+    """
+    Yields content deltas from an OpenAI-style chat-completions SSE stream.
+    Token counts, when the provider sends them, are copied into `usage`.
+    """
+    for line in resp.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        try:
+            chunk = json.loads(data)
+        except ValueError:
+            continue
+        if usage is not None and chunk.get("usage"):
+            usage.update(chunk["usage"])
+        choices = chunk.get("choices") or []
+        if choices:
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
+
+
+def stream_llm_json(prompt_text, images_b64=None, required=("submit_url", "answer"), model=DEFAULT_MODEL, cancel=None):
+    """
+    Streams a completion and returns its JSON object as soon as every field in
+    `required` is complete, closing the connection so the rest of the
+    generation is cancelled. Falls back to parsing the whole text if the
+    stream ends first. Returns None on API errors (or when `cancel` is set)
+    and {} when the output holds no JSON object.
+    """
+    headers, payload = _build_request(prompt_text, images_b64, model=model, stream=True)
+    parser = JSONFieldStream()
+    start = time.time()
+    ttft = None
+    cut_short = False
+    usage = {}
+
+    try:
+        with span("llm", model=model, stream=True):
+            resp = http_client.post(AIPIPE_URL, headers=headers, json=payload, timeout=LLM_TIMEOUT, stream=True)
+            if isinstance(cancel, RaceCancel):
+                cancel.attach(resp)
+            try:
+                resp.raise_for_status()
+                resp.encoding = "utf-8"  # text/event-stream would otherwise default to latin-1
+                for delta in _iter_sse_deltas(resp, usage):
+                    if cancel is not None and cancel.is_set():
+                        logger.info(f"LLM stream for {model} cancelled.")
+                        return None
+                    if ttft is None:
+                        ttft = time.time() - start
+                    parser.feed(delta)
+                    if parser.has(*required):
+                        cut_short = not parser.complete
+                        break
+            finally:
+                resp.close()
+    except Exception as e:
+        if cancel is not None and cancel.is_set():
+            logger.info(f"LLM stream for {model} cancelled.")
+            return None
+        llm_requests.inc(model=model, status="error")
+        logger.error(f"LLM API Error: {e}")
+        return None
+
+    total = time.time() - start
+    llm_requests.inc(model=model, status="ok")
+    if ttft is not None:
+        llm_ttft.observe(ttft, model=model)
+    _record_usage(model, usage)
+    ttft_text = f"{ttft:.2f}s" if ttft is not None else "n/a"
+    logger.info(f"⚡ LLM stream ({model}): TTFT {ttft_text}, total {total:.2f}s, {len(parser.buf)} chars"
+                f"{' (cancelled remaining generation)' if cut_short else ''}")
+
+    if parser.has(*required):
+        return parser.fields
+
+    # Model didn't produce a clean object; try the whole text the old way
+    clean_out = parser.buf.replace("```json", "").replace("```", "").strip()
+    try:
+        data = json.loads(clean_out)
+        return data if isinstance(data, dict) else {}
+    except ValueError:
+        logger.warning(f"LLM stream did not contain valid JSON: {clean_out[:200]}")
+        return {}
+
+
+def race_llm_json(prompt_text, images_b64=None, models=None, required=("submit_url", "answer")):
+    """
+    Streams the same prompt to several models at once and returns the first
+    response containing every `required` field; the others are cancelled.
+    Like raceLLMs in the Node backend.
+    """
+    models = models or RACE_MODELS or [DEFAULT_MODEL]
+    cancel = RaceCancel()
+    futures = {
+        submit(stream_llm_json, prompt_text, images_b64, required=required, model=model, cancel=cancel): model
+        for model in models
+    }
+    logger.info(f"🏁 Racing {len(models)} models")
+    fallback = None
+    try:
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.warning(f"Model {futures[future]} failed: {e}")
+                continue
+            if result and all(name in result for name in required):
+                logger.info(f"🏆 Winner: {futures[future]}")
+                return result
+            if fallback is None:
+                fallback = result
+    finally:
+        cancel.set()
+    return fallback
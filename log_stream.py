@@ -0,0 +1,126 @@
+import os
+import json
+import logging
+import threading
+from collections import deque
+from quiz_state import current_job, current_question
+
+# --- CONFIGURATION ---
+RING_SIZE = 5000              # records kept in memory for /logs/stream
+TAIL_BLOCK = 64 * 1024        # bytes read per step when tailing backwards
+
+
+class ContextFilter(logging.Filter):
+    """Tags every record with the job and question of the thread that logged it."""
+
+    def filter(self, record):
+        job = current_job()
+        question = current_question()
+        record.job_id = job.id if job is not None else None
+        record.question_id = question.id if question is not None else None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, so tails and streams can be filtered by job."""
+
+    def format(self, record):
+        return json.dumps(record_to_dict(record, self), ensure_ascii=False)
+
+
+class ConsoleFormatter(logging.Formatter):
+    def format(self, record):
+        line = super().format(record)
+        job_id = getattr(record, "job_id", None)
+        if job_id:
+            question_id = getattr(record, "question_id", None)
+            line = f"[{job_id}{'/' + question_id if question_id else ''}] {line}"
+        return line
+
+
+def record_to_dict(record, formatter):
+    entry = {
+        "ts": record.created,
+        "time": formatter.formatTime(record),
+        "level": record.levelname,
+        "logger": record.name,
+        "thread": record.threadName,
+        "job_id": getattr(record, "job_id", None),
+        "question_id": getattr(record, "question_id", None),
+        "message": record.getMessage(),
+    }
+    if record.exc_info:
+        entry["exception"] = formatter.formatException(record.exc_info)
+    return entry
+
+
+def entry_to_line(entry):
+    """A record dict as the console/plain-text line: [job/question] time [LEVEL] message."""
+    if "time" not in entry:
+        return entry.get("message", "")  # a line that wasn't JSON, kept as it was
+    line = f"{entry.get('time', '')} [{entry.get('level', 'INFO')}] {entry.get('message', '')}"
+    if entry.get("job_id"):
+        question_id = entry.get("question_id")
+        line = f"[{entry['job_id']}{'/' + question_id if question_id else ''}] {line}"
+    if entry.get("exception"):
+        line += "\n" + entry["exception"]
+    return line
+
+
+class RingBufferHandler(logging.Handler):
+    """
+    Keeps the last RING_SIZE records in memory with increasing sequence
+    numbers. Readers ask for everything after the last sequence they saw and
+    can block until something new arrives.
+    """
+
+    def __init__(self, capacity=RING_SIZE):
+        super().__init__()
+        self._records = deque(maxlen=capacity)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._formatter = logging.Formatter()
+
+    def emit(self, record):
+        try:
+            entry = record_to_dict(record, self._formatter)
+        except Exception:
+            self.handleError(record)
+            return
+        with self._cond:
+            self._seq += 1
+            entry["seq"] = self._seq
+            self._records.append(entry)
+            self._cond.notify_all()
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    def since(self, seq, job_id=None, limit=None):
+        with self._cond:
+            records = [r for r in self._records if r["seq"] > seq and (job_id is None or r["job_id"] == job_id)]
+        return records[-limit:] if limit else records
+
+    def wait(self, seq, timeout):
+        """Blocks until a record newer than `seq` exists or `timeout` passes."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._seq > seq, timeout)
+
+
+def tail_lines(path, count):
+    """Last `count` lines of `path`, read backwards from the end in blocks."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b""
+        while position > 0 and data.count(b"\n") <= count:
+            step = min(TAIL_BLOCK, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = data.decode("utf-8", errors="replace").splitlines()
+    return lines[-count:]
+
+
+ring_buffer = RingBufferHandler()
@@ -1,14 +1,31 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 import logging
+import logging.handlers
 import os
+import json
+import asyncio
+from typing import Optional
 from datetime import datetime
-from utils import run_quiz_chain
+from browser_manager import browser_manager
+from job_manager import job_manager, QueueFull
+from sandbox import sandbox_pool
+from pdf_extractor import pdf_extractor
+import prefetcher
+from download_cache import download_cache
+from transcript_cache import transcript_cache
+from lazy_loader import warm_up, readiness
+import metrics
+from log_stream import ContextFilter, JsonFormatter, ConsoleFormatter, ring_buffer, tail_lines, entry_to_line
 
 # --- CONFIGURATION ---
 EXPECTED_SECRET = "123"
+WARM_UP = os.environ.get("WARM_UP", "1") != "0"
+LOG_MAX_BYTES = 10 * 1024 * 1024   # rotate the session log at this size
+LOG_BACKUPS = 5                    # rotated files kept (app_....log.1 ... .5)
+MAX_TAIL_LINES = 2000
 
 # --- LOGGING SETUP ---
 # Create logs directory
@@ -18,19 +35,34 @@ os.makedirs("logs", exist_ok=True)
 timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 log_filename = f"logs/app_{timestamp}.log"
 
-# Configure logging to write to file AND console
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(log_filename),
-        logging.StreamHandler()
-    ]
-)
+# JSON lines to a size-rotated file, readable lines to the console, and an
+# in-memory ring buffer for /logs/stream. Every record carries job/question IDs.
+file_handler = logging.handlers.RotatingFileHandler(log_filename, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+file_handler.setFormatter(JsonFormatter())
+console_handler = logging.StreamHandler()
+console_handler.setFormatter(ConsoleFormatter("%(asctime)s [%(levelname)s] %(message)s"))
+for handler in (file_handler, console_handler, ring_buffer):
+    handler.addFilter(ContextFilter())
+
+logging.basicConfig(level=logging.INFO, handlers=[file_handler, console_handler, ring_buffer])
 logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+@app.on_event("startup")
+def start_warm_up():
+    # Heavy dependencies load lazily; warm them in the background once we're serving
+    if WARM_UP:
+        warm_up()
+
+@app.on_event("shutdown")
+def shutdown_browser():
+    job_manager.shutdown()
+    sandbox_pool.close()
+    pdf_extractor.close()
+    prefetcher.close()
+    browser_manager.close()
+
 # --- CUSTOM EXCEPTION HANDLER ---
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
@@ -46,7 +78,7 @@ class QuizRequest(BaseModel):
     url: str
 
 @app.post("/llm-quiz")
-async def start_quiz(task: QuizRequest, background_tasks: BackgroundTasks):
+async def start_quiz(task: QuizRequest):
     # 1. Log the Full Payload
     logger.info(f"📥 RECEIVED PAYLOAD: {task.model_dump_json()}")
 
@@ -55,22 +87,95 @@ async def start_quiz(task: QuizRequest, background_tasks: BackgroundTasks):
         logger.warning(f"⛔ Invalid Secret received: {task.secret}")
         raise HTTPException(status_code=403, detail="Invalid secret")
 
-    # 3. Add task to background
-    background_tasks.add_task(run_quiz_chain, task.email, task.secret, task.url)
+    # 3. Queue the chain on the job pool
+    try:
+        job = job_manager.submit(task.email, task.secret, task.url)
+    except QueueFull as e:
+        logger.warning(f"🚦 Job queue full: {e}")
+        raise HTTPException(status_code=429, detail="Too many quizzes in progress, retry later")
+
+    return {"message": "Quiz started", "status": "processing", "job_id": job.id,
+            "status_url": f"/jobs/{job.id}", "log_file": log_filename}
 
-    return {"message": "Quiz started", "status": "processing", "log_file": log_filename}
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
 @app.get("/")
 def home():
-    return {"status": "Active", "current_log_file": log_filename}
+    return {"status": "Active", "current_log_file": log_filename, "jobs": job_manager.stats()}
+
+@app.get("/health")
+def health():
+    return {
+        "status": "healthy",
+        "jobs": job_manager.stats(),
+        "download_cache": download_cache.stats(),
+        "transcript_cache": transcript_cache.stats(),
+    }
+
+@app.get("/ready")
+def ready():
+    """Per-component readiness. Anything not ready yet is loaded on first use."""
+    components = readiness()
+    return {
+        "ready": all(c["status"] == "ready" for c in components.values()),
+        "components": components,
+    }
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus scrape endpoint: stage latencies, LLM tokens, retries, cache hits, bytes downloaded."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/logs")
-def get_logs():
-    """Returns the content of the current session's log file."""
+def get_logs(lines: int = 200, job_id: Optional[str] = None):
+    """
+    Last `lines` records of the session log, as text (current_log) and as
+    parsed records. With job_id, the records of that job still held in memory.
+    """
+    lines = max(1, min(lines, MAX_TAIL_LINES))
     try:
-        with open(log_filename, "r") as f:
-            lines = f.readlines()
-            # Return last 200 lines to avoid payload size issues
-            return {"current_log": "".join(lines[-200:])} 
+        if job_id:
+            records = ring_buffer.since(0, job_id, limit=lines)
+        else:
+            # Reads backwards from the end; cost doesn't grow with the file
+            records = []
+            for line in tail_lines(log_filename, lines):
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    records.append({"message": line})
+        current_log = "".join(entry_to_line(record) + "\n" for record in records)
+        return {"current_log": current_log, "log_file": log_filename, "records": records}
     except Exception as e:
-        return {"error": str(e)}
+        # Same keys as a successful read, so clients reading current_log don't break
+        return {"current_log": "", "log_file": log_filename, "records": [], "error": str(e)}
+
+@app.get("/logs/stream")
+async def stream_logs(request: Request, job_id: Optional[str] = None, since: Optional[int] = None):
+    """
+    Server-Sent Events: one `log` event per new record (optionally only one
+    job's), starting after `since` / Last-Event-ID, or from now.
+    """
+    last_event = request.headers.get("last-event-id")
+    if since is None and last_event and last_event.isdigit():
+        since = int(last_event)
+    last = ring_buffer.last_seq if since is None else since
+
+    async def events():
+        nonlocal last
+        while not await request.is_disconnected():
+            newest = ring_buffer.last_seq
+            records = ring_buffer.since(last, job_id)
+            for record in records:
+                yield f"id: {record['seq']}\nevent: log\ndata: {json.dumps(record, ensure_ascii=False)}\n\n"
+            last = max(newest, records[-1]["seq"]) if records else newest
+            if not records and not await asyncio.to_thread(ring_buffer.wait, last, 15):
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+TRACE_DIR = os.environ.get("TRACE_DIR", "logs/traces")
+MAX_TRACE_FILES = 500                 # oldest traces beyond this are deleted
+MAX_TRACE_BYTES = 100 * 1024 * 1024   # ...and beyond this total size
+PRUNE_EVERY = 20                      # saves between prunes
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels. Rendered as <name> in Prometheus text format."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, "") for name in self.labels), 0)
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        if not values and not self.labels:
+            values = {(): 0}
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in sorted(values.items())]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with _bucket/_sum/_count series per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=STAGE_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        lines = []
+        for key, series in sorted(snapshot.items()):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels + ('le',), key + (bound,))} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels + ('le',), key + ('+Inf',))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format (0.0.4)."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- SHARED METRICS ---
+stage_seconds = Histogram("stage_duration_seconds", "Time spent per pipeline stage.", labels=("stage",))
+stage_errors = Counter("stage_errors_total", "Stages that ended with an exception.", labels=("stage",))
+cache_requests = Counter("cache_requests_total", "Cache lookups by cache and result.", labels=("cache", "result"))
+
+
+# --- TRACES ---
+_current_trace = contextvars.ContextVar("trace", default=None)
+_saves = 0
+_saves_lock = threading.Lock()
+
+
+class Trace:
+    """The spans recorded while one unit of work (a question, a request) ran, for post-mortems."""
+
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, stage, started, elapsed, status, attrs):
+        with self._lock:
+            self.spans.append({
+                "stage": stage,
+                "offset": round(started - self.started_at, 4),
+                "duration": round(elapsed, 4),
+                "status": status,
+                "thread": threading.current_thread().name,
+                **attrs,
+            })
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["offset"])
+        return {"name": self.name, "started_at": self.started_at,
+                "duration": time.time() - self.started_at, **self.attrs, "spans": spans}
+
+    def save(self, filename):
+        path = os.path.join(TRACE_DIR, filename)
+        try:
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(self.to_dict(), f, indent=1, default=str)
+        except OSError as e:
+            logger.warning(f"Could not save trace {path}: {e}")
+            return None
+        global _saves
+        with _saves_lock:
+            _saves += 1
+            due = _saves % PRUNE_EVERY == 1
+        if due:
+            prune_traces()
+        return path
+
+
+def prune_traces(max_files=MAX_TRACE_FILES, max_bytes=MAX_TRACE_BYTES):
+    """Deletes the oldest trace files until both limits hold."""
+    try:
+        entries = [(e.stat().st_mtime, e.stat().st_size, e.path) for e in os.scandir(TRACE_DIR) if e.is_file()]
+    except OSError:
+        return
+    entries.sort()
+    count, total = len(entries), sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if count <= max_files and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        count -= 1
+        total -= size
+
+
+@contextmanager
+def trace(name, **attrs):
+    """Collects every span started in this context (and threads it spawns) into a Trace."""
+    current = Trace(name, **attrs)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(stage, **attrs):
+    """Times a stage into stage_duration_seconds and the current trace, if any."""
+    started = time.time()
+    status = "ok"
+    try:
+        yield
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        elapsed = time.time() - started
+        stage_seconds.observe(elapsed, stage=stage)
+        if status != "ok":
+            stage_errors.inc(stage=stage)
+        current = _current_trace.get()
+        if current is not None:
+            current.add(stage, started, elapsed, status, attrs)
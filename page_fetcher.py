@@ -0,0 +1,77 @@
+import re
+import logging
+from bs4 import BeautifulSoup
+import http_client
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+STATIC_TIMEOUT = 10                 # read timeout for the plain GET
+MAX_STATIC_BYTES = 2 * 1024 * 1024  # bigger pages go to the browser (or are not pages at all)
+MIN_STATIC_TEXT = 200               # less visible text than this, with scripts around, means a JS shell
+MAX_TEXT_CHARS = 3000
+
+APP_ROOTS = re.compile(r"^(root|app|__next|__nuxt|svelte|main-app)$", re.I)
+NOSCRIPT_HINT = re.compile(r"enable javascript|requires javascript|javascript is (disabled|required)", re.I)
+CHARSET = re.compile(r"charset=[\"']?([\w.:-]+)", re.I)
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+
+
+def looks_js_rendered(soup):
+    """
+    True when the static HTML is only a shell for client-side rendering:
+    an empty SPA mount point, a noscript "enable JavaScript" notice, or
+    scripts but next to no visible text. Strips script/style/noscript tags.
+    """
+    for node in soup.find_all(id=APP_ROOTS):
+        if not node.get_text(strip=True):
+            return True
+    for node in soup.find_all("noscript"):
+        if NOSCRIPT_HINT.search(node.get_text(" ", strip=True)):
+            return True
+    has_scripts = soup.find("script") is not None
+    for tag in soup(["script", "style", "noscript"]):
+        tag.decompose()
+    return has_scripts and len(soup.get_text(" ", strip=True)) < MIN_STATIC_TEXT
+
+
+def fetch_static_text(url):
+    """
+    Fetches `url` with a plain GET and returns its visible text (first
+    MAX_TEXT_CHARS), or None when the page needs a real browser: it is
+    rendered by JavaScript, is not HTML/text, is too large, or the GET failed.
+    """
+    try:
+        resp = http_client.get(url, timeout=STATIC_TIMEOUT, retries=0, stream=True)  # the browser is the retry
+    except Exception as e:
+        logger.info(f"Static fetch failed for {url} ({e}); using browser.")
+        return None
+
+    try:
+        header = resp.headers.get("Content-Type", "")
+        content_type = header.split(";")[0].strip().lower()
+        charset = CHARSET.search(header)
+        if not resp.ok or not (content_type in HTML_TYPES or content_type == "text/plain"):
+            return None
+        length = resp.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > MAX_STATIC_BYTES:
+            return None
+        body = resp.raw.read(MAX_STATIC_BYTES + 1, decode_content=True)
+        if len(body) > MAX_STATIC_BYTES:
+            return None
+    finally:
+        resp.close()
+
+    # No charset header: let the parser read <meta charset> instead of assuming latin-1
+    try:
+        html = body.decode(charset.group(1), errors="replace") if charset else body
+    except LookupError:
+        html = body
+    if content_type == "text/plain":
+        text = html if isinstance(html, str) else html.decode("utf-8", errors="replace")
+        return text[:MAX_TEXT_CHARS]
+
+    soup = BeautifulSoup(html, "html.parser")
+    if looks_js_rendered(soup):
+        return None
+    return soup.get_text(separator=" ", strip=True)[:MAX_TEXT_CHARS]
@@ -0,0 +1,264 @@
+import io
+import os
+import re
+import logging
+import importlib
+import tempfile
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+import http_client
+import shm_budget
+from lazy_loader import LazyComponent
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+PDF_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+PAGES_PER_TASK = 4          # pages extracted per worker call; smaller PDFs are done inline
+MAX_PDF_PAGES = 60          # pages read from one PDF at most
+MAX_PDF_CHARS = 60000       # stop once this much text is extracted (context is trimmed to ~48k anyway)
+MIN_TABLE_ROWS = 3          # consecutive aligned lines (header included) that count as a table
+MIN_NUMERIC_LINES = 3       # lines with 2+ numbers before a page is re-read in layout mode
+
+COLUMN_GAP = re.compile(r"\s{2,}")
+NUMBER = re.compile(r"^[-+(]?[$€£]?\d[\d,]*(\.\d+)?%?\)?$")
+
+
+# --- WORKER PROCESS ---
+_document = None  # (source, PdfReader) of the PDF this worker last read
+
+
+def _init_worker():
+    import pypdf  # noqa: F401  imported once per worker
+
+
+def _read_source(source, size):
+    kind, name = source
+    if kind == "file":
+        with open(name, "rb") as f:
+            return f.read(size)
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        # The parent owns the block; stop this process's tracker from unlinking it
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    try:
+        return bytes(shm.buf[:size])
+    finally:
+        shm.close()
+
+
+def _open_document(source, size):
+    global _document
+    if _document is not None and _document[0] == source:
+        return _document[1]
+    import pypdf
+    _document = (source, pypdf.PdfReader(io.BytesIO(_read_source(source, size))))
+    return _document[1]
+
+
+def _extract_range(source, size, start, stop):
+    """source is ("shm", block name) or ("file", path) holding the PDF bytes."""
+    reader = _open_document(source, size)
+    return extract_pages(reader, start, stop)
+
+
+# --- PAGE EXTRACTION (shared by workers and the inline path) ---
+def _looks_tabular(text):
+    numeric_lines = 0
+    for line in text.splitlines():
+        if sum(1 for token in line.split() if NUMBER.match(token)) >= 2:
+            numeric_lines += 1
+            if numeric_lines >= MIN_NUMERIC_LINES:
+                return True
+    return False
+
+
+def find_table_rows(text):
+    """
+    Returns the longest run of consecutive lines that split into the same
+    number (2+) of columns on runs of 2+ spaces, or None.
+    """
+    best, run, width = [], [], None
+    for line in text.splitlines():
+        cells = [c.strip() for c in COLUMN_GAP.split(line.strip()) if c.strip()]
+        if len(cells) >= 2 and len(cells) == width:
+            run.append(cells)
+        else:
+            if len(run) > len(best):
+                best = run
+            run, width = ([cells], len(cells)) if len(cells) >= 2 else ([], None)
+    if len(run) > len(best):
+        best = run
+    return best if len(best) >= MIN_TABLE_ROWS else None
+
+
+def extract_pages(reader, start, stop):
+    """Returns [(page_number, text, table_rows_or_None)] for pages start..stop-1."""
+    results = []
+    for number in range(start, stop):
+        page = reader.pages[number]
+        text = page.extract_text() or ""
+        rows = None
+        if _looks_tabular(text):
+            try:
+                # Layout mode keeps column gaps, which plain mode collapses
+                rows = find_table_rows(page.extract_text(extraction_mode="layout") or "")
+            except TypeError:  # pypdf < 3.17
+                rows = find_table_rows(text)
+        results.append((number, text, rows))
+    return results
+
+
+def merge_tables(pages):
+    """
+    Groups per-page table rows into tables, joining a table that continues
+    on the next page with the same columns (dropping a repeated header).
+    Returns [(first_page, last_page, rows)].
+    """
+    tables = []
+    for number, _, rows in pages:
+        if not rows:
+            continue
+        if tables:
+            first, last, previous = tables[-1]
+            if last == number - 1 and len(rows[0]) == len(previous[0]):
+                tables[-1] = (first, number, previous + (rows[1:] if rows[0] == previous[0] else rows))
+                continue
+        tables.append((number, number, rows))
+    return tables
+
+
+# --- PARENT SIDE ---
+class PdfExtractor:
+    """
+    Page-parallel PDF text extraction on a process pool.
+
+    The PDF is copied once into shared memory (a temp file when it is too
+    big for /dev/shm); workers read batches of
+    PAGES_PER_TASK pages from it. Batches are submitted a few at a time in
+    page order and extraction stops as soon as the in-order text reaches
+    `max_chars`, `max_pages` is hit or the question's deadline runs out, so a
+    300-page report costs about as much as its first few pages.
+    """
+
+    def __init__(self, workers=PDF_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=mp.get_context("spawn"), initializer=_init_worker)
+                logger.info(f"📄 PDF pool started with {self.workers} workers")
+            return self._executor
+
+    def extract(self, data, max_pages=MAX_PDF_PAGES, max_chars=MAX_PDF_CHARS):
+        """
+        Returns (pages, total_pages, stop_reason) where pages is an in-order
+        list of (page_number, text, table_rows_or_None) and stop_reason is
+        None when every page was read.
+        """
+        reader = pypdf.get().PdfReader(io.BytesIO(data))
+        total = len(reader.pages)
+        count = min(total, max_pages)
+
+        if count <= PAGES_PER_TASK:
+            pages = extract_pages(reader, 0, count)
+            return self._trim(pages, total, max_chars, "page limit" if count < total else None)
+
+        if shm_budget.fits(len(data)):
+            shm = shared_memory.SharedMemory(create=True, size=len(data))
+            try:
+                shm.buf[:len(data)] = data
+                pages, reason = self._extract_parallel(("shm", shm.name), len(data), count, max_chars)
+            finally:
+                shm.close()
+                shm.unlink()
+        else:
+            with tempfile.NamedTemporaryFile(suffix=".pdf") as f:
+                f.write(data)
+                f.flush()
+                pages, reason = self._extract_parallel(("file", f.name), len(data), count, max_chars)
+        if reason is None and count < total:
+            reason = "page limit"
+        return self._trim(pages, total, max_chars, reason)
+
+    def _extract_parallel(self, source, size, count, max_chars):
+        executor = self.start()
+        batches = [(start, min(start + PAGES_PER_TASK, count)) for start in range(0, count, PAGES_PER_TASK)]
+        pending = {}      # future -> batch index
+        done = {}         # batch index -> pages
+        next_batch = 0    # next batch to submit
+        next_ready = 0    # next batch to append in order
+        pages, chars, reason = [], 0, None
+
+        try:
+            while next_ready < len(batches):
+                while next_batch < len(batches) and len(pending) < self.workers * 2:
+                    start, stop = batches[next_batch]
+                    pending[executor.submit(_extract_range, source, size, start, stop)] = next_batch
+                    next_batch += 1
+
+                remaining = http_client.time_left()
+                if remaining is not None and remaining <= 0:
+                    reason = "time limit"
+                    break
+                finished, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                if not finished:
+                    reason = "time limit"
+                    break
+                for future in finished:
+                    done[pending.pop(future)] = future.result()
+
+                while next_ready in done:
+                    for page in done.pop(next_ready):
+                        pages.append(page)
+                        chars += len(page[1])
+                    next_ready += 1
+                if chars >= max_chars:
+                    reason = "text budget"
+                    break
+        except BrokenProcessPool:
+            self._reset()
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+        return pages, reason
+
+    @staticmethod
+    def _trim(pages, total, max_chars, reason):
+        chars = 0
+        for index, (_, text, _) in enumerate(pages):
+            chars += len(text)
+            if chars >= max_chars and index + 1 < len(pages):
+                return pages[:index + 1], total, "text budget"
+        return pages, total, reason
+
+    def _reset(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+        logger.warning("PDF pool broke; it will be restarted on next use.")
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+pypdf = LazyComponent("pypdf", lambda: importlib.import_module("pypdf"))
+pdf_extractor = PdfExtractor()
+
+# Warm-up / readiness hook: starts the pool (workers spawn on first submit)
+pdf_pool = LazyComponent("pdf_pool", pdf_extractor.start)
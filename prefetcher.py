@@ -0,0 +1,110 @@
+import time
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import http_client
+from metrics import Counter, span, trace
+from quiz_state import QuestionState, set_current_question
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+PREFETCH_NEXT = True       # scrape the next question while the current one is still retrying
+PREFETCH_WORKERS = 4       # prefetches running at the same time, across all chains
+
+_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+
+prefetch_total = Counter("quiz_prefetch_total", "Next-question prefetches, by outcome.", labels=("outcome",))
+
+
+class Prefetch:
+    """
+    A background scrape of a question the chain has not reached yet.
+
+    It runs with its own QuestionState as the current question, so a df
+    loaded from its attachments lands on the next question and never on the
+    one still being retried.
+    """
+
+    def __init__(self, url, load, max_time):
+        self.url = url
+        self.state = QuestionState(url)
+        self.state.prefetched = True
+        self.trace = None
+        self._future = _pool.submit(contextvars.copy_context().run, self._run, load, max_time)
+
+    def _run(self, load, max_time):
+        set_current_question(self.state)
+        # Its own deadline and trace; the current question's must not bound or collect it
+        with http_client.deadline(time.time() + max_time), trace("prefetch", url=self.url) as self.trace:
+            with span("prefetch"):
+                return load(self.url)
+
+    def done(self):
+        return self._future.done()
+
+    def result(self):
+        """The loader's result, waiting for it if needed; None if the prefetch failed."""
+        try:
+            return self._future.result()
+        except Exception as e:
+            logger.warning(f"Prefetch of {self.url} failed: {e}")
+            return None
+
+    def cancel(self):
+        # A scrape already running can't be interrupted; its result is just dropped
+        self._future.cancel()
+
+
+class ChainPrefetcher:
+    """
+    Holds at most one prefetch per chain: the URL most recently announced as
+    next. Announcing a different URL drops the old prefetch; advancing to a
+    URL hands over the matching prefetch, or drops it if another URL won.
+    """
+
+    def __init__(self, load, max_time):
+        self._load = load
+        self._max_time = max_time
+        self._current = None
+        self._lock = threading.Lock()
+
+    def start(self, url):
+        if not PREFETCH_NEXT or not url:
+            return
+        with self._lock:
+            if self._current is not None and self._current.url == url:
+                return
+            old, self._current = self._current, Prefetch(url, self._load, self._max_time)
+        if old is not None:
+            self._drop(old, f"superseded by {url}")
+        logger.info(f"🔮 Prefetching next question: {url}")
+
+    def take(self, url):
+        """The prefetch for `url` if there is one; any other prefetch is discarded."""
+        with self._lock:
+            current, self._current = self._current, None
+        if current is None:
+            return None
+        if current.url != url:
+            self._drop(current, f"chain moved to {url}")
+            return None
+        prefetch_total.inc(outcome="used" if current.done() else "waited")
+        return current
+
+    def discard(self):
+        with self._lock:
+            current, self._current = self._current, None
+        if current is not None:
+            self._drop(current, "chain finished")
+
+    @staticmethod
+    def _drop(prefetch, reason):
+        prefetch.cancel()
+        prefetch_total.inc(outcome="discarded")
+        logger.info(f"🗑️ Discarded prefetch of {prefetch.url} ({reason})")
+
+
+def close():
+    _pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,108 @@
+import time
+import uuid
+import threading
+import contextvars
+
+# The job and question being worked on by the current thread. Both are copied
+# into scrape/LLM worker threads along with the rest of the context, so
+# concurrent chains never see each other's DataFrame or history.
+_current_job = contextvars.ContextVar("quiz_job", default=None)
+_current_question = contextvars.ContextVar("quiz_question", default=None)
+
+
+class QuestionState:
+    """Everything one chain link accumulates while it is being solved."""
+
+    def __init__(self, url):
+        self.id = uuid.uuid4().hex[:8]
+        self.url = url
+        self.dataframe = None
+        self.page_context = ""
+        self.attempt_history = ""
+        self.attempts = 0
+        self.status = "scraping"
+        self.started_at = time.time()
+        self.finished_at = None
+        self.next_url = None
+        self.trace_file = None
+        self.prefetched = False   # scraped in the background before the chain got here
+
+    def finish(self, status, next_url=None):
+        self.status = status
+        self.next_url = next_url
+        self.finished_at = time.time()
+
+    def to_dict(self):
+        df = self.dataframe
+        return {
+            "id": self.id,
+            "url": self.url,
+            "status": self.status,
+            "attempts": self.attempts,
+            "dataframe_shape": list(df.shape) if df is not None else None,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed": (self.finished_at or time.time()) - self.started_at,
+            "next_url": self.next_url,
+            "trace_file": self.trace_file,
+            "prefetched": self.prefetched,
+        }
+
+
+class QuizJob:
+    """One /llm-quiz request: a chain of questions run on a job worker."""
+
+    def __init__(self, email, secret, start_url):
+        self.id = uuid.uuid4().hex[:12]
+        self.email = email
+        self.secret = secret
+        self.start_url = start_url
+        self.status = "queued"
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.questions = []
+        self._lock = threading.Lock()
+
+    def add_question(self, question):
+        with self._lock:
+            self.questions.append(question)
+
+    def to_dict(self):
+        with self._lock:
+            questions = [q.to_dict() for q in self.questions]
+        return {
+            "id": self.id,
+            "email": self.email,
+            "start_url": self.start_url,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "current_url": questions[-1]["url"] if questions else None,
+            "questions_attempted": len(questions),
+            "questions_correct": sum(1 for q in questions if q["status"] == "correct"),
+            "questions": questions,
+        }
+
+
+def current_job():
+    return _current_job.get()
+
+
+def current_question():
+    return _current_question.get()
+
+
+def set_current_job(job):
+    return _current_job.set(job)
+
+
+def set_current_question(question):
+    return _current_question.set(question)
+
+
+def reset_current_question(token):
+    _current_question.reset(token)
@@ -0,0 +1,127 @@
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+# Starting guesses (seconds) until real measurements come in
+DEFAULT_ESTIMATES = {"scrape": 20.0, "answer": 8.0, "submit": 1.0}
+EWMA_ALPHA = 0.3
+SAFETY_MARGIN = 1.2          # pad estimates; an attempt cut by the deadline is wasted
+WRONG_ANSWER_DELAY = 1.0     # pause before retrying a wrong answer (was a fixed 10s)
+GLITCH_BACKOFF_BASE = 0.5
+GLITCH_BACKOFF_CAP = 4.0
+MIN_GLITCH_DELAY = 0.25      # even out of slack; fast-failing calls must not spin
+RESCRAPE_AFTER_WRONG = 3     # consecutive wrong answers before the page is scraped again
+MOVE_ON_AFTER_WRONG = 6      # wrong answers before giving up on a question that has a next URL
+
+# Step latencies are shared across questions so a new question starts from
+# what the previous ones measured rather than from the defaults.
+_estimates = dict(DEFAULT_ESTIMATES)
+_estimates_lock = threading.Lock()
+
+
+def record_latency(step, seconds):
+    with _estimates_lock:
+        previous = _estimates.get(step)
+        if previous is None:
+            _estimates[step] = seconds
+        else:
+            _estimates[step] = (1 - EWMA_ALPHA) * previous + EWMA_ALPHA * seconds
+
+
+def estimate(step):
+    with _estimates_lock:
+        return _estimates.get(step, 0.0)
+
+
+class QuestionScheduler:
+    """
+    Tracks one question's remaining time budget and decides, from measured
+    step latencies, whether to retry, re-scrape, or move on to the next URL.
+    """
+
+    RETRY = "retry"
+    RESCRAPE = "rescrape"
+    MOVE_ON = "move_on"
+
+    def __init__(self, max_time, start_time=None):
+        self.start_time = start_time if start_time is not None else time.time()
+        self.deadline = self.start_time + max_time
+        self.wrong_answers = 0
+        self.consecutive_wrong = 0
+        self.glitches = 0
+        self.rescraped = False
+
+    def remaining(self):
+        return self.deadline - time.time()
+
+    @contextmanager
+    def measure(self, step):
+        started = time.time()
+        try:
+            with span(step):
+                yield
+        finally:
+            record_latency(step, time.time() - started)
+
+    def attempt_cost(self):
+        return (estimate("answer") + estimate("submit")) * SAFETY_MARGIN
+
+    def can_attempt(self):
+        return self.remaining() > self.attempt_cost()
+
+    # --- OUTCOMES ---
+    def on_wrong_answer(self):
+        self.wrong_answers += 1
+        self.consecutive_wrong += 1
+        self.glitches = 0
+
+    def on_glitch(self):
+        self.glitches += 1
+
+    def on_rescrape(self):
+        self.rescraped = True
+        self.consecutive_wrong = 0
+
+    # --- DECISIONS ---
+    def next_action(self, next_url_known):
+        """What to do before the next attempt: RETRY, RESCRAPE or MOVE_ON."""
+        if next_url_known:
+            if not self.can_attempt():
+                logger.info(f"⏭️ {self.remaining():.0f}s left, an attempt takes ~{self.attempt_cost():.0f}s. Moving on.")
+                return self.MOVE_ON
+            if self.wrong_answers >= MOVE_ON_AFTER_WRONG:
+                logger.info(f"⏭️ {self.wrong_answers} wrong answers. Moving on.")
+                return self.MOVE_ON
+
+        if (self.consecutive_wrong >= RESCRAPE_AFTER_WRONG and not self.rescraped
+                and self.remaining() > estimate("scrape") * SAFETY_MARGIN + self.attempt_cost()):
+            logger.info("🔄 Repeated wrong answers. Re-scraping the page.")
+            return self.RESCRAPE
+
+        return self.RETRY
+
+    def wait_after_wrong(self):
+        return self._clip(WRONG_ANSWER_DELAY)
+
+    def wait_after_glitch(self):
+        delay = random.uniform(MIN_GLITCH_DELAY, max(MIN_GLITCH_DELAY, min(GLITCH_BACKOFF_CAP, GLITCH_BACKOFF_BASE * (2 ** self.glitches))))
+        return max(MIN_GLITCH_DELAY, self._clip(delay))
+
+    def scrape_budget(self, default):
+        """Time a re-scrape may take while still leaving room for one attempt."""
+        return max(0, min(default, self.remaining() - self.attempt_cost()))
+
+    def _clip(self, delay):
+        # Never sleep away time an attempt would need
+        slack = self.remaining() - self.attempt_cost()
+        return max(0.0, min(delay, slack))
+
+    def sleep(self, delay):
+        if delay > 0:
+            time.sleep(delay)
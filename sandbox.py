@@ -0,0 +1,296 @@
+import os
+import queue
+import tempfile
+import signal
+import logging
+import threading
+import multiprocessing as mp
+from collections import OrderedDict
+from multiprocessing import shared_memory
+from lazy_loader import LazyComponent
+import shm_budget
+
+try:
+    import resource
+except ImportError:  # not available on Windows; limits are skipped there
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+POOL_SIZE = 2
+CPU_LIMIT = 10                      # CPU seconds per snippet
+WALL_TIMEOUT = 20                   # wall-clock seconds per snippet, enforced by the parent
+MEMORY_LIMIT = 2 * 1024 ** 3        # address space per worker
+MAX_SHARED_FRAMES = 4               # DataFrames kept exported to shared memory
+MAX_CALLS_PER_WORKER = 200          # recycle workers periodically to cap leaks
+
+
+class SandboxError(Exception):
+    pass
+
+
+# --- WORKER PROCESS ---
+def _worker_main(conn, memory_limit):
+    # Heavy imports happen once per worker, not once per snippet
+    import pandas as pd
+    import numpy as np
+    import scipy
+    import networkx as nx
+    try:
+        import pyarrow as pa
+    except ImportError:
+        pa = None
+
+    if resource is not None:
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        except (ValueError, OSError) as e:
+            logger.warning(f"Could not set sandbox memory limit: {e}")
+
+        def _on_cpu_limit(signum, frame):
+            raise TimeoutError("CPU time limit exceeded")
+        signal.signal(signal.SIGXCPU, _on_cpu_limit)
+
+    frames = OrderedDict()  # shm name -> (DataFrame, SharedMemory) already decoded by this worker
+    conn.send(("ready", os.getpid()))
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+
+        code, frame_ref, cpu_limit = message
+        try:
+            df = _load_frame(frame_ref, frames, pa)
+            if resource is not None:
+                usage = resource.getrusage(resource.RUSAGE_SELF)
+                _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+                soft = int(usage.ru_utime + usage.ru_stime + cpu_limit) + 1
+                if hard != resource.RLIM_INFINITY: soft = min(soft, hard)
+                resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+            try:
+                result = eval(code, {"df": df, "pd": pd, "np": np, "scipy": scipy, "nx": nx})
+                conn.send(("ok", str(result)))
+            finally:
+                if resource is not None:
+                    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+                    resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+        except MemoryError:
+            conn.send(("recycle", "Memory limit exceeded"))
+            return
+        except TimeoutError as e:
+            conn.send(("recycle", str(e)))
+            return
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+def _load_frame(frame_ref, frames, pa):
+    if frame_ref is None:
+        return None
+    kind, payload = frame_ref
+    if kind == "pickle":
+        return payload
+
+    name = payload
+    if name in frames:
+        frames.move_to_end(name)
+        return frames[name][0]
+
+    if kind == "file":
+        # Too big for /dev/shm: the parent wrote an Arrow file; map it instead of copying
+        source = pa.memory_map(name)
+        df = pa.ipc.open_stream(source).read_pandas()
+    else:
+        source = shared_memory.SharedMemory(name=name)
+        try:
+            # The parent owns the block; stop this process's tracker from unlinking it
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(source._name, "shared_memory")
+        except Exception:
+            pass
+        # The DataFrame may still point into the block, so it stays mapped while cached
+        df = pa.ipc.open_stream(pa.py_buffer(source.buf)).read_pandas()
+
+    frames[name] = (df, source)
+    while len(frames) > MAX_SHARED_FRAMES:
+        _, (old_df, old_shm) = frames.popitem(last=False)
+        del old_df
+        try:
+            old_shm.close()
+        except BufferError:
+            pass
+    return df
+
+
+# --- PARENT SIDE ---
+class _FrameFile:
+    """An exported DataFrame on disk; same close/unlink interface as a SharedMemory block."""
+
+    kind = "file"
+
+    def __init__(self, name):
+        self.name = name
+
+    def close(self):
+        pass
+
+    def unlink(self):
+        os.remove(self.name)
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, MEMORY_LIMIT), daemon=True, name="sandbox-worker")
+        self.process.start()
+        child_conn.close()
+        self.calls = 0
+        self.ready = False
+
+    def wait_ready(self, timeout):
+        if not self.ready:
+            if not self.conn.poll(timeout):
+                raise SandboxError("Sandbox worker did not start in time")
+            self.conn.recv()
+            self.ready = True
+
+    def kill(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=1)
+
+
+class SandboxPool:
+    """
+    Long-lived worker processes for LLM-generated pandas expressions.
+
+    Workers import pandas/numpy/scipy/networkx once. DataFrames are exported
+    once to shared memory as Arrow IPC and decoded by each worker on first use,
+    so retries on the same question don't re-send the data. Each snippet runs
+    under a CPU-time limit (RLIMIT_CPU), a per-worker memory cap (RLIMIT_AS)
+    and a wall-clock timeout; a worker that crashes or trips a limit is
+    replaced.
+    """
+
+    def __init__(self, size=POOL_SIZE):
+        self.size = size
+        self._ctx = mp.get_context("spawn")
+        self._idle = queue.Queue()
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._frames = OrderedDict()  # id(df) -> (df, SharedMemory)
+        self._frames_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._started:
+                return
+            for _ in range(self.size):
+                self._idle.put(_Worker(self._ctx))
+            self._started = True
+            logger.info(f"🧪 Sandbox pool started with {self.size} workers")
+
+    def run(self, code, df=None, cpu_limit=CPU_LIMIT, timeout=WALL_TIMEOUT):
+        """Evaluates `code` with `df` in a worker and returns str(result)."""
+        self.start()
+        frame_ref = self._export(df) if df is not None else None
+        worker = self._idle.get()
+        healthy = False
+        try:
+            worker.wait_ready(timeout=60)
+            worker.conn.send((code, frame_ref, cpu_limit))
+            if not worker.conn.poll(timeout):
+                raise SandboxError(f"Timed out after {timeout}s")
+            status, value = worker.conn.recv()
+            worker.calls += 1
+            # "error" is the snippet's own exception; "recycle" means a limit was hit
+            healthy = status in ("ok", "error")
+            if status == "ok":
+                return value
+            raise SandboxError(value)
+        except (EOFError, OSError):
+            raise SandboxError("Sandbox worker crashed")
+        finally:
+            if healthy and worker.calls < MAX_CALLS_PER_WORKER:
+                self._idle.put(worker)
+            else:
+                worker.kill()
+                self._idle.put(_Worker(self._ctx))
+
+    def _export(self, df):
+        with self._frames_lock:
+            entry = self._frames.get(id(df))
+            if entry is not None and entry[0] is df:
+                self._frames.move_to_end(id(df))
+                return (getattr(entry[1], "kind", "shm"), entry[1].name)
+
+        try:
+            import pyarrow as pa
+            table = pa.Table.from_pandas(df)
+            mock = pa.MockOutputStream()
+            with pa.ipc.new_stream(mock, table.schema) as writer:
+                writer.write_table(table)
+            if shm_budget.fits(mock.size()):
+                shm = shared_memory.SharedMemory(create=True, size=max(1, mock.size()))
+                target = pa.py_buffer(shm.buf)
+                sink = pa.FixedSizeBufferWriter(target)
+                with pa.ipc.new_stream(sink, table.schema) as writer:
+                    writer.write_table(table)
+                sink.close()
+                del sink, target  # release the export on shm.buf so it can be closed later
+            else:
+                # Too big for /dev/shm; workers memory-map an Arrow file instead
+                fd, path = tempfile.mkstemp(prefix="sandbox-frame-", suffix=".arrows")
+                os.close(fd)
+                with pa.OSFile(path, "wb") as sink, pa.ipc.new_stream(sink, table.schema) as writer:
+                    writer.write_table(table)
+                shm = _FrameFile(path)
+        except Exception as e:
+            logger.warning(f"Arrow export failed ({e}); pickling DataFrame to the sandbox.")
+            return ("pickle", df)
+
+        with self._frames_lock:
+            # Keep df referenced so its id() can't be reused while exported
+            self._frames[id(df)] = (df, shm)
+            while len(self._frames) > MAX_SHARED_FRAMES:
+                _, (_, old) = self._frames.popitem(last=False)
+                self._release(old)
+        return (getattr(shm, "kind", "shm"), shm.name)
+
+    @staticmethod
+    def _release(shm):
+        try:
+            shm.close()
+            shm.unlink()
+        except Exception:
+            pass
+
+    def close(self):
+        with self._start_lock:
+            while not self._idle.empty():
+                worker = self._idle.get_nowait()
+                try:
+                    worker.conn.send(None)
+                except Exception:
+                    pass
+                worker.kill()
+            self._started = False
+        with self._frames_lock:
+            for _, shm in self._frames.values():
+                self._release(shm)
+            self._frames.clear()
+
+
+sandbox_pool = SandboxPool()
+
+# Warm-up / readiness hook: spawns the workers (they import pandas & co. themselves)
+sandbox = LazyComponent("sandbox", sandbox_pool.start)
@@ -0,0 +1,19 @@
+import os
+
+# --- CONFIGURATION ---
+# Docker gives containers a 64 MiB /dev/shm by default, and writing past a
+# tmpfs limit through a mapping is a SIGBUS, not an exception
+MAX_SHM_BYTES = 32 * 1024 * 1024   # largest single block put in shared memory
+SHM_PATH = "/dev/shm"
+
+
+def fits(size):
+    """True if a shared-memory block of `size` bytes can be created safely; otherwise use a fallback."""
+    if size > MAX_SHM_BYTES:
+        return False
+    try:
+        stats = os.statvfs(SHM_PATH)
+    except (OSError, AttributeError):
+        return True  # no tmpfs-backed /dev/shm on this platform
+    # Leave half the free space for other blocks being written at the same time
+    return size <= stats.f_bavail * stats.f_frsize // 2
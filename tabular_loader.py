@@ -0,0 +1,211 @@
+import io
+import os
+import csv
+import hashlib
+import logging
+import importlib
+from lazy_loader import LazyComponent
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+SAMPLE_BYTES = 64 * 1024                 # read to detect delimiter and header
+LARGE_FILE_BYTES = 64 * 1024 * 1024      # above this, parse in batches into an on-disk Arrow file
+CATEGORY_MAX_RATIO = 0.5                 # object columns with fewer distinct values than this share -> category
+TABLE_CACHE_DIR = "cache/tables"
+MAX_TABLE_CACHE_BYTES = 2 * 1024 ** 3
+DELIMITERS = ",\t;|"
+
+pandas = LazyComponent("pandas", lambda: importlib.import_module("pandas"))
+
+
+def _is_number(value):
+    try:
+        float(str(value).strip().replace(",", "").strip("$€£%"))
+        return True
+    except ValueError:
+        return False
+
+
+def looks_like_header(first_row, second_row):
+    """True if `first_row` reads as column names for the rows below it."""
+    if not first_row:
+        return False
+    # Text over a number in the same column means a header ("name,2020,2021" over "A,1,2");
+    # otherwise a numeric first cell means the first row is data
+    return (any(not _is_number(a) and _is_number(b) for a, b in zip(first_row, second_row) if a.strip() and b.strip())
+            or not _is_number(first_row[0]))
+
+
+def sniff(data, default_sep=","):
+    """Detects (delimiter, has_header) from the first SAMPLE_BYTES of the file."""
+    sample = data[:SAMPLE_BYTES].decode("utf-8", errors="replace")
+    if len(data) > SAMPLE_BYTES:
+        sample = sample.rsplit("\n", 1)[0]  # drop the cut-off last line
+    try:
+        sep = csv.Sniffer().sniff(sample, delimiters=DELIMITERS).delimiter
+    except csv.Error:
+        sep = default_sep
+    rows = csv.reader(io.StringIO(sample), delimiter=sep)
+    first_row = next(rows, [])
+    second_row = next(rows, [])
+    return sep, looks_like_header(first_row, second_row)
+
+
+def _read_csv(data, sep, has_header):
+    pd = pandas.get()
+    kwargs = {"sep": sep, "header": 0 if has_header else None}
+    try:
+        return pd.read_csv(io.BytesIO(data), engine="pyarrow", **kwargs)
+    except (ImportError, ValueError) as e:
+        # No pyarrow, or input it rejects (ragged rows, odd quoting)
+        logger.info(f"pyarrow CSV engine unavailable for this file ({e}); using the C engine.")
+        return pd.read_csv(io.BytesIO(data), **kwargs)
+
+
+def source_size(source):
+    """Size of a download given as bytes or as an open binary file."""
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    return os.fstat(source.fileno()).st_size
+
+
+def read_source(source, size=-1):
+    """The download's bytes (the first `size` of them), reading a file from the start."""
+    if isinstance(source, (bytes, bytearray)):
+        return source if size < 0 else source[:size]
+    source.seek(0)
+    return source.read(size)
+
+
+def _digest(source):
+    if isinstance(source, (bytes, bytearray)):
+        return hashlib.sha256(source).hexdigest()
+    source.seek(0)
+    digest = hashlib.sha256()
+    for block in iter(lambda: source.read(1024 * 1024), b""):
+        digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_large_csv(source, sep, has_header):
+    """
+    Parses block by block - straight from the file when given one - into an
+    Arrow IPC stream under TABLE_CACHE_DIR (keyed by content hash, so retries
+    skip parsing) and loads it through a memory map. Columns stay Arrow-backed
+    (pd.ArrowDtype), so the DataFrame reads from the mapped file instead of
+    copying it into NumPy arrays and Python strings.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    pd = pandas.get()
+
+    os.makedirs(TABLE_CACHE_DIR, exist_ok=True)
+    digest = _digest(source)
+    path = os.path.join(TABLE_CACHE_DIR, f"{digest}-{ord(sep)}-{int(has_header)}.arrows")
+    if not os.path.exists(path):
+        if isinstance(source, (bytes, bytearray)):
+            stream = pa.BufferReader(source)
+        else:
+            source.seek(0)
+            stream = pa.PythonFile(source, mode="r")
+        reader = pacsv.open_csv(
+            stream,
+            read_options=pacsv.ReadOptions(autogenerate_column_names=not has_header, block_size=8 * 1024 * 1024),
+            parse_options=pacsv.ParseOptions(delimiter=sep),
+        )
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_stream(sink, reader.schema) as writer:
+                for batch in reader:
+                    writer.write_batch(batch)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        _evict_tables()
+    else:
+        os.utime(path)
+
+    # Left open: the DataFrame's buffers point into the mapping
+    table = pa.ipc.open_stream(pa.memory_map(path)).read_all()
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def _evict_tables():
+    try:
+        entries = [e for e in os.scandir(TABLE_CACHE_DIR) if e.is_file() and not e.name.endswith(".tmp")]
+    except OSError:
+        return
+    total = sum(e.stat().st_size for e in entries)
+    for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+        if total <= MAX_TABLE_CACHE_BYTES:
+            break
+        try:
+            size = entry.stat().st_size
+            os.remove(entry.path)
+            total -= size
+        except OSError:
+            pass
+
+
+def optimize_dtypes(df):
+    """
+    Downcasts numbers where lossless and turns low-cardinality strings into
+    categoricals. Only for files too large to hold otherwise: small ints
+    overflow in the snippets the LLM writes (df.a * df.b), and categoricals
+    change value_counts()/groupby output.
+    """
+    pd = pandas.get()
+    rows = len(df)
+    for column in df.columns:
+        series = df[column]
+        kind = series.dtype.kind
+        if kind in "iu":
+            df[column] = pd.to_numeric(series, downcast="integer" if kind == "i" else "unsigned")
+        elif kind == "f":
+            smaller = pd.to_numeric(series, downcast="float")
+            # float32 would change sums/means the quiz checks exactly; keep it only if lossless
+            if smaller.dtype != series.dtype and (smaller.astype(series.dtype) == series).where(series.notna(), True).all():
+                df[column] = smaller
+        elif kind == "O" and rows >= 50:
+            if series.nunique(dropna=True) <= rows * CATEGORY_MAX_RATIO:
+                df[column] = series.astype("category")
+    return df
+
+
+def load_table(source, kind):
+    """
+    Parses a CSV/TSV/JSON download - its bytes, or the cached file opened for
+    reading - into a compact DataFrame in one pass. Large CSV/TSV files are
+    never read into memory whole. Raises ValueError when a JSON file is not
+    tabular.
+    """
+    pd = pandas.get()
+    large = source_size(source) > LARGE_FILE_BYTES
+    if kind == "json":
+        df = pd.read_json(io.BytesIO(read_source(source)))
+    else:
+        # One byte past the sample tells sniff() the last line may be cut off
+        sep, has_header = sniff(read_source(source, SAMPLE_BYTES + 1), default_sep="\t" if kind == "tsv" else ",")
+        df = None
+        if large:
+            try:
+                df = _read_large_csv(source, sep, has_header)
+                large = False  # already Arrow-backed; nothing left to shrink
+            except Exception as e:
+                logger.warning(f"Batched Arrow load failed ({e}); parsing in memory.")
+        if df is None:
+            df = _read_csv(read_source(source), sep, has_header)
+        if not has_header:
+            df.columns = [f"col_{i}" for i in range(len(df.columns))]
+
+    df.columns = df.columns.astype(str)
+    return optimize_dtypes(df) if large else df
+
+
+def describe_table(df):
+    """Schema and sample rows from dtypes and the first rows only - no pass over the data."""
+    schema = "\n".join(f" {name}: {dtype}" for name, dtype in df.dtypes.items())
+    return (f"{len(df)} rows x {len(df.columns)} columns\n{schema}",
+            df.head(3).to_markdown())
@@ -0,0 +1,108 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from metrics import cache_requests
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+# Used by both the solver and the Whisper service (backend/PythonAPI). The
+# default is anchored at the repo root, not the working directory, so both
+# processes share one store; keys include the model, so entries are shared
+# when they also run the same WHISPER_MODEL
+CACHE_DIR = os.environ.get("TRANSCRIPT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "transcripts"))
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def make_key(audio_sha256, model_name, **params):
+    """Cache key: audio content hash + model + every decoding parameter that changes the output."""
+    options = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(f"{audio_sha256}|{model_name}|{options}".encode("utf-8")).hexdigest()
+
+
+class TranscriptCache:
+    """
+    Persistent transcript store: one small JSON file per key, evicted
+    least-recently-used (by mtime) once the directory exceeds max_bytes.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._sizes = {}
+        for entry in os.scandir(cache_dir):
+            if entry.name.endswith(".json"):
+                self._sizes[entry.name[:-5]] = entry.stat().st_size
+        self._total = sum(self._sizes.values())
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                value = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            cache_requests.inc(cache="transcript", result="miss")
+            return None
+        with self._lock:
+            self.hits += 1
+        cache_requests.inc(cache="transcript", result="hit")
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(value, f)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write transcript cache entry: {e}")
+            return
+        with self._lock:
+            self._total += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Caller holds the lock
+        def _mtime(key):
+            try:
+                return os.path.getmtime(self._path(key))
+            except OSError:
+                return 0
+        for key in sorted(self._sizes, key=_mtime):
+            if self._total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            self._total -= self._sizes.pop(key)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._sizes),
+                "bytes": self._total,
+            }
+
+
+transcript_cache = TranscriptCache()
@@ -1,27 +1,43 @@
 import os
+import re
 import json
 import time
-import requests
+import http_client
 import logging
-import re
-import base64
-from urllib.parse import urljoin, urlparse
-from playwright.sync_api import sync_playwright
+from urllib.parse import urljoin
 from bs4 import BeautifulSoup
-from faster_whisper import WhisperModel
-import pypdf
-import pandas as pd
 import io
 import zipfile
+import hashlib
+import asyncio
+import threading
+import itertools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+from lazy_loader import LazyComponent
+from browser_manager import browser_manager
+from download_cache import download_cache
+from transcript_cache import transcript_cache, make_key as make_transcript_key
+from llm_client import get_llm_response, stream_llm_json, race_llm_json, RACE_MODELS
+from llm_client import submit as submit_llm_task
+from context_builder import build_context, trim_history, DF_MARKER
+from retry_scheduler import QuestionScheduler
+from sandbox import sandbox_pool
+from pdf_extractor import pdf_extractor, merge_tables
+from tabular_loader import pandas, load_table, describe_table, looks_like_header, source_size, read_source
+from image_pipeline import prepare_image, ImageDeduper
+from page_fetcher import fetch_static_text
+from prefetcher import ChainPrefetcher
+from metrics import Counter, span, trace
+from quiz_state import QuestionState, current_job, current_question, set_current_question, reset_current_question
 
 # --- CONFIGURATION ---
-AIPIPE_TOKEN = "apikey"
-AIPIPE_URL = "https://aipipe.org/openrouter/v1/chat/completions"
+LLM_STREAMING = True  # stream the answer JSON and stop as soon as it is complete
+SPECULATIVE_ANSWER = True  # ask for the direct answer while the code path runs
+MAX_TIME = 170  # seconds per question
 
 logger = logging.getLogger(__name__)
 
-current_dataframe = None
-
 # --- FILE EXTENSIONS ---
 EXT_AUDIO = ('.mp3', '.wav', '.ogg', '.flac', '.m4a', '.aac', '.wma', '.opus', '.webm', '.mid', '.midi')
 EXT_VIDEO = ('.mp4', '.mkv', '.webm', '.avi', '.mov', '.wmv', '.flv', '.mpeg', '.mpg', '.m4v', '.3gp')
@@ -31,185 +47,464 @@ EXT_TEXT  = ('.txt', '.md', '.log', '.py', '.js', '.html', '.css', '.java', '.c'
 EXT_ARCHIVE = ('.zip',)
 EXT_IMAGE = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
 
-# Initialize Whisper
-try:
-    whisper_model = WhisperModel("tiny", device="cpu", compute_type="int8")
-    logger.info("Whisper model loaded.")
-except Exception as e:
-    logger.error(f"Failed to load Whisper: {e}")
-    whisper_model = None
+# --- SCRAPING LIMITS ---
+SCRAPE_BUDGET = 60          # seconds a question may spend fetching its page + attachments
+MAX_PARALLEL_FETCHES = 6    # attachments/sub-pages fetched at the same time
+EXTRACT_WORKERS = 8         # threads for downloads/extractors, shared by every scrape
+MAX_IMAGES = 3              # images attached to the LLM prompt
+MAX_IMAGE_CANDIDATES = 6    # images downloaded to pick those 3 from
+MAX_MEDIA_BYTES = 100 * 1024 * 1024  # audio/video downloads larger than this are skipped
+NETWORK_IDLE_TIMEOUT = 10000  # ms to wait for the question page to go quiet after DOMContentLoaded
 
-def get_llm_response(prompt_text, images_b64=None):
-    """
-    Sends text AND a list of images to LLM.
-    """
-    headers = {
-        "Authorization": f"Bearer {AIPIPE_TOKEN}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://hf.space"
-    }
-    
-    # Construct Content Payload
-    content_payload = [{"type": "text", "text": prompt_text}]
-    
-    # Add Images if present
-    if images_b64:
-        for i, img_str in enumerate(images_b64):
-            if len(img_str) > 0: 
-                content_payload.append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{img_str}"
-                    }
-                })
-
-    payload = {
-        "model": "openai/gpt-4o-mini", 
-        "messages": [{"role": "user", "content": content_payload}]
-    }
-    
-    try:
-        resp = requests.post(AIPIPE_URL, headers=headers, json=payload, timeout=60)
-        resp.raise_for_status()
-        return resp.json()['choices'][0]['message']['content']
-    except Exception as e:
-        logger.error(f"LLM API Error: {e}")
-        return None
+# --- ARCHIVE LIMITS ---
+MAX_ARCHIVE_BYTES = 200 * 1024 * 1024        # compressed download
+MAX_ARCHIVE_MEMBERS = 100                    # members processed per archive
+MAX_MEMBER_BYTES = 50 * 1024 * 1024          # uncompressed size of one member
+MAX_ARCHIVE_TOTAL_BYTES = 300 * 1024 * 1024  # uncompressed size of everything, nested archives included
+MAX_COMPRESSION_RATIO = 100                  # higher ratios look like a zip bomb
+MAX_ARCHIVE_DEPTH = 2                        # zips inside zips
+ARCHIVE_WORKERS = 4                          # members handled at the same time
+
+# --- METRICS ---
+questions_total = Counter("quiz_questions_total", "Questions finished, by final status.", labels=("status",))
+attempts_total = Counter("quiz_attempts_total", "Answer attempts, by outcome.", labels=("outcome",))
+
+# --- LAZY DEPENDENCIES ---
+# Loaded on first use (or by the background warm-up) so importing utils,
+# and therefore binding the server port, stays fast.
+WHISPER_MODEL_NAME = os.environ.get("WHISPER_MODEL", "tiny")
+WHISPER_BEAM_SIZE = 5
+WHISPER_WORKERS = max(1, min(4, (os.cpu_count() or 1) // 2))  # chunks transcribed at once
+LONG_MEDIA_SECONDS = 90    # longer media is split at silences and transcribed in parallel
+CHUNK_SECONDS = 30
+TRANSCRIBE_MARGIN = 15     # seconds of the question budget left for answering; later chunks are dropped
+
+def _load_whisper():
+    from faster_whisper import WhisperModel
+    # num_workers lets the one model serve that many transcribe() calls in parallel
+    return WhisperModel(WHISPER_MODEL_NAME, device="cpu", compute_type="int8", num_workers=WHISPER_WORKERS,
+                        cpu_threads=max(1, (os.cpu_count() or 1) // WHISPER_WORKERS))
+
+whisper = LazyComponent("whisper", _load_whisper)
+_whisper_pool = ThreadPoolExecutor(max_workers=WHISPER_WORKERS, thread_name_prefix="whisper")
+
+def _transcribe_chunk(model, audio, offset):
+    segments, info = model.transcribe(audio, beam_size=WHISPER_BEAM_SIZE)
+    # segments is lazy; the actual decoding happens while iterating
+    return [{"start": seg.start + offset, "end": seg.end + offset, "text": seg.text} for seg in segments], info
+
+def transcribe_bytes(data):
+    whisper_model = whisper.get_or_none()
+    if not whisper_model:
+        return "[Whisper model not loaded]"
+
+    cache_key = make_transcript_key(hashlib.sha256(data).hexdigest(), WHISPER_MODEL_NAME, beam_size=WHISPER_BEAM_SIZE, language=None)
+    cached = transcript_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"TRANSCRIPTION (cached): {cached['text']}")
+        return cached["text"]
+
+    # Decode straight from the in-memory bytes to 16 kHz PCM: no temp
+    # file, and the only large allocation is the sample array itself
+    from faster_whisper import decode_audio
+    from chunker import SAMPLE_RATE, split_on_silence, stitch
+    with span("whisper", bytes=len(data)):
+        audio = decode_audio(io.BytesIO(data), sampling_rate=SAMPLE_RATE)
+        if len(audio) > LONG_MEDIA_SECONDS * SAMPLE_RATE:
+            with span("vad_split"):
+                ranges = split_on_silence(audio, CHUNK_SECONDS)
+            logger.info(f"Long media ({len(audio) / SAMPLE_RATE:.0f}s): {len(ranges)} chunks across {WHISPER_WORKERS} workers")
+        else:
+            ranges = [(0, len(audio))]
+        futures = [_whisper_pool.submit(_transcribe_chunk, whisper_model, audio[start:end], start / SAMPLE_RATE)
+                   for start, end in ranges]
+        # Whatever is transcribed when the question budget runs low goes to the LLM
+        remaining = http_client.time_left()
+        done, not_done = wait(futures, timeout=None if remaining is None else max(0, remaining - TRANSCRIBE_MARGIN))
+        for future in not_done:
+            future.cancel()
+        parts, info = {}, None
+        for index, future in enumerate(futures):
+            if future in done:
+                parts[index], chunk_info = future.result()
+                if index == 0: info = chunk_info
+        text, _ = stitch(parts)
+
+    if not_done:
+        logger.warning(f"TRANSCRIPTION (partial, {len(parts)}/{len(ranges)} chunks): {text}")
+        return text + f"\n[...transcript incomplete: {len(parts)} of {len(ranges)} chunks done in time]"
+    logger.info(f"TRANSCRIPTION: {text}") 
+    transcript_cache.put(cache_key, {"text": text, "language": info.language, "duration": len(audio) / SAMPLE_RATE})
+    return text
 
 def transcribe_media(media_url):
     try:
         logger.info(f"Downloading media: {media_url}")
-        resp = requests.get(media_url)
-        path = urlparse(media_url).path
-        ext = os.path.splitext(path)[1] or ".mp3"
-        filename = f"temp_media{ext}"
-        with open(filename, "wb") as f:
-            f.write(resp.content)
-        
-        if whisper_model:
-            segments, _ = whisper_model.transcribe(filename)
-            text = " ".join([s.text for s in segments])
-            logger.info(f"TRANSCRIPTION: {text}") 
-        else:
-            text = "[Whisper model not loaded]"
-        
-        if os.path.exists(filename): os.remove(filename)
-        return text
+        data = download_cache.fetch(media_url, max_bytes=MAX_MEDIA_BYTES)
+        return transcribe_bytes(data)
     except Exception as e:
         logger.error(f"Media error: {e}")
         return f"[Error extracting media: {e}]"
 
+def _table_to_dataframe(rows):
+    """Turns aligned PDF rows into a DataFrame, using the first row as header when it reads like one."""
+    pd = pandas.get()
+    width = len(rows[0])
+    if not looks_like_header(rows[0], rows[1] if len(rows) > 1 else []):
+        df = pd.DataFrame(rows, columns=[f"col_{i}" for i in range(width)])
+    else:
+        # Repeated or blank header cells would make df[column] a DataFrame
+        columns, seen = [], set()
+        for i, cell in enumerate(rows[0]):
+            name = str(cell).strip() or f"col_{i}"
+            while name in seen:
+                name = f"{name}_{i}"
+            seen.add(name)
+            columns.append(name)
+        df = pd.DataFrame(rows[1:], columns=columns)
+    for column in df.columns:
+        try:
+            df[column] = pd.to_numeric(df[column].str.replace(r"[,$€£%]", "", regex=True))
+        except (ValueError, TypeError):
+            pass
+    return df
+
+def pdf_text_from_bytes(data):
+    started = time.time()
+    with span("pdf", bytes=len(data)):
+        pages, total, stop_reason = pdf_extractor.extract(data)
+    text = "\n".join(page_text for _, page_text, _ in pages)
+    logger.info(f"PDF: {len(pages)}/{total} pages, {len(text)} chars in {time.time() - started:.2f}s")
+    if stop_reason:
+        text += f"\n[...stopped after {len(pages)} of {total} pages ({stop_reason})]"
+
+    tables = merge_tables(pages)
+    if tables:
+        first, last, rows = max(tables, key=lambda t: len(t[2]))
+        try:
+            df = _table_to_dataframe(rows)
+        except Exception as e:
+            # The table is a bonus; never lose the page text over it
+            logger.warning(f"PDF table recovery failed: {e}")
+            return text
+        question = current_question()
+        # A real data file wins over a table recovered from a PDF
+        if question is not None and question.dataframe is None:
+            _store_dataframe(df, source="pdf")
+        pages_label = f"page {first + 1}" if first == last else f"pages {first + 1}-{last + 1}"
+        text += (f"\n\nPDF TABLE ({pages_label}, {len(df)} rows) {_table_label(df)}."
+                 f"\nCOLUMNS: {list(df.columns)}\nSAMPLE ROWS:\n{df.head(3).to_markdown()}")
+    return text
+
 def extract_pdf_text(pdf_url):
     try:
         logger.info(f"Downloading PDF: {pdf_url}")
-        resp = requests.get(pdf_url)
-        with io.BytesIO(resp.content) as f:
-            reader = pypdf.PdfReader(f)
-            text = "\n".join([page.extract_text() for page in reader.pages])
-        return text
+        data = download_cache.fetch(pdf_url)
+        return pdf_text_from_bytes(data)
     except Exception as e:
         logger.error(f"PDF error: {e}")
         return f"[Error extracting PDF: {e}]"
 
+def text_from_bytes(data):
+    return data[:60000].decode('utf-8', errors='replace')[:15000]
+
 def extract_text_file(text_url):
     try:
         logger.info(f"Downloading Text file: {text_url}")
-        resp = requests.get(text_url)
-        return resp.content.decode('utf-8', errors='replace')[:15000] 
+        data = download_cache.fetch(text_url)
+        return text_from_bytes(data)
     except Exception as e:
         logger.error(f"Text error: {e}")
         return f"[Error reading text file: {e}]"
 
-def handle_zip_file(zip_url):
+class _ArchiveBudget:
+    """Uncompressed bytes an archive, nested archives included, may still expand to."""
+
+    def __init__(self, total):
+        self.remaining = total
+        self._lock = threading.Lock()
+
+    def take(self, size):
+        with self._lock:
+            if size > self.remaining:
+                return False
+            self.remaining -= size
+            return True
+
+def _extract_member(z, info, name, depth, budget):
+    """Runs one archive member through the handler its extension maps to. Returns (text, images)."""
+    lower = name.lower()
+    try:
+        with z.open(info) as member:
+            data = member.read(MAX_MEMBER_BYTES + 1)
+        if len(data) > MAX_MEMBER_BYTES:
+            return f"[Skipped: expands beyond {MAX_MEMBER_BYTES} bytes]", []
+
+        if lower.endswith(EXT_IMAGE):
+            return None, [prepare_image(data)]
+        if lower.endswith(EXT_AUDIO) or lower.endswith(EXT_VIDEO):
+            return transcribe_bytes(data), []
+        if lower.endswith(EXT_PDF):
+            return pdf_text_from_bytes(data), []
+        if lower.endswith(EXT_DATA):
+            try:
+                return data_file_from_bytes(data, name), []
+            except Exception as e:
+                logger.error(f"Data load error for {name}: {e}")
+                return text_from_bytes(data), []
+        if lower.endswith(EXT_ARCHIVE):
+            if depth >= MAX_ARCHIVE_DEPTH:
+                return "[Nested archive not opened: depth limit]", []
+            return _extract_archive(io.BytesIO(data), depth + 1, budget, prefix=f"{name}/")
+        if lower.endswith(EXT_TEXT) or b"\x00" not in data[:8192]:
+            return text_from_bytes(data), []
+        return None, []
+    except Exception as e:
+        logger.error(f"ZIP member {name} failed: {e}")
+        return f"[Error extracting {name}: {e}]", []
+
+def _extract_archive(f, depth=0, budget=None, prefix=""):
+    budget = budget or _ArchiveBudget(MAX_ARCHIVE_TOTAL_BYTES)
+    with zipfile.ZipFile(f) as z:
+        members, skipped = [], []
+        for info in z.infolist():
+            name = info.filename
+            if info.is_dir() or name.startswith("__MACOSX/") or os.path.basename(name).startswith("."):
+                continue
+            if len(members) >= MAX_ARCHIVE_MEMBERS:
+                skipped.append(f"{name} (member limit)")
+            elif info.file_size > MAX_MEMBER_BYTES:
+                skipped.append(f"{name} ({info.file_size} bytes)")
+            elif info.compress_size and info.file_size / info.compress_size > MAX_COMPRESSION_RATIO:
+                skipped.append(f"{name} (compression ratio {info.file_size // info.compress_size}:1)")
+            elif not budget.take(info.file_size):
+                skipped.append(f"{name} (archive size limit)")
+            else:
+                members.append(info)
+
+        # ZipFile serialises reads on the shared file; the handlers run in parallel
+        member_tables = [[] for _ in members]
+        with ThreadPoolExecutor(max_workers=ARCHIVE_WORKERS, thread_name_prefix="zip") as pool:
+            futures = [pool.submit(contextvars.copy_context().run, _collect_tables, tables,
+                                   _extract_member, z, info, prefix + info.filename, depth, budget)
+                       for info, tables in zip(members, member_tables)]
+            results = [future.result() for future in futures]
+    # In member order, whichever member finished first
+    _adopt_tables([table for tables in member_tables for table in tables])
+
     extracted_data = ""
+    images = []
+    for info, (text, member_images) in zip(members, results):
+        images.extend(member_images)
+        if text is not None and not info.filename.lower().endswith(EXT_ARCHIVE):
+            extracted_data += f"\n=== ZIP CONTENT: {prefix}{info.filename} ===\n{text}\n"
+        elif text is not None:
+            extracted_data += text
+    if skipped:
+        logger.warning(f"ZIP: skipped {len(skipped)} members: {skipped[:10]}")
+        extracted_data += f"\n[Skipped {len(skipped)} archive members: {', '.join(skipped[:10])}]\n"
+    return extracted_data, images
+
+def handle_zip_file(zip_url):
+    """Returns (text, images_b64) for every member of the archive."""
     try:
         logger.info(f"Downloading ZIP file: {zip_url}")
-        resp = requests.get(zip_url)
-        with zipfile.ZipFile(io.BytesIO(resp.content)) as z:
-            for filename in z.namelist():
-                if filename.endswith(('.csv', '.json', '.txt', '.md', '.sql', '.xml')):
-                    with z.open(filename) as f:
-                        content = f.read().decode('utf-8', errors='ignore')[:5000]
-                        extracted_data += f"\n=== ZIP CONTENT: {filename} ===\n{content}\n"
-        return extracted_data
+        # Spooled to the on-disk cache and read from there, never held whole in memory
+        with span("zip"), download_cache.fetch_file(zip_url, max_bytes=MAX_ARCHIVE_BYTES) as f:
+            return _extract_archive(f)
     except Exception as e:
         logger.error(f"ZIP error: {e}")
-        return f"[Error extracting ZIP: {e}]"
+        return f"[Error extracting ZIP: {e}]", []
 
-def download_image_as_base64(img_url):
-    """Downloads an image and converts to Base64 string."""
+def download_image(img_url):
+    """Downloads an image and prepares it for the LLM (downscaled, re-encoded, hashed)."""
     try:
         logger.info(f"Downloading Image: {img_url}")
-        resp = requests.get(img_url, timeout=10)
-        # Basic check
-        if resp.status_code != 200: return None
-        return base64.b64encode(resp.content).decode('utf-8')
+        with span("image"):
+            data = download_cache.fetch(img_url)
+            return prepare_image(data)
     except Exception as e:
         logger.error(f"Image download failed: {e}")
         return None
 
+# DataFrames loaded by an extractor running concurrently with others are
+# collected here and adopted by the scrape after the gather, in link order
+_table_sink = contextvars.ContextVar("table_sink", default=None)
+
+def _store_dataframe(df, source="file"):
+    """Makes df the `df` of the question being solved (or hands it to the scrape collecting tables)."""
+    _adopt_tables([(source, df)])
+
+def _adopt_tables(tables):
+    """Takes (source, df) pairs in link order: the last data file wins, a PDF table only if there is none."""
+    if not tables:
+        return
+    sink = _table_sink.get()
+    if sink is not None:
+        sink.extend(tables)
+        return
+    question = current_question()
+    if question is not None:
+        files = [df for source, df in tables if source == "file"]
+        question.dataframe = files[-1] if files else tables[-1][1]
+
+# Handlers can't know which of the tables they load ends up as `df`, so they
+# write a placeholder that the scrape fills in once that has been decided
+_table_numbers = itertools.count(1)
+TABLE_PLACEHOLDER = re.compile(r"\[\[table (\d+)\]\]")
+
+def _table_label(df):
+    df.attrs["table_number"] = number = next(_table_numbers)
+    return f"[[table {number}]]"
+
+def _label_tables(text):
+    """Marks the table that became `df` as loaded and every other one as not loaded."""
+    question = current_question()
+    adopted = question.dataframe.attrs.get("table_number") if question is not None and question.dataframe is not None else None
+    return TABLE_PLACEHOLDER.sub(
+        lambda m: DF_MARKER if int(m.group(1)) == adopted else "extracted (not loaded into df)", text)
+
+def _collect_tables(tables, fn, *args):
+    """Runs fn with the DataFrames it loads appended to `tables`. Call inside a copied context."""
+    _table_sink.set(tables)
+    return fn(*args)
+
+def data_file_from_bytes(data, name):
+    """`data` is the file's bytes or, for downloads, the cached file opened for reading."""
+    lower = name.lower()
+    if lower.endswith('.sql'):
+        return text_from_bytes(read_source(data, 60000))
+
+    kind = "json" if lower.endswith('.json') else "tsv" if lower.endswith('.tsv') else "csv"
+    try:
+        with span("data_load", kind=kind, bytes=source_size(data)):
+            df = load_table(data, kind)
+    except ValueError:
+        if kind != "json":
+            raise
+        logger.info("JSON is not tabular. Reading as plain text.")
+        return text_from_bytes(read_source(data, 60000))
+
+    _store_dataframe(df)
+    schema_info, sample = describe_table(df)
+    
+    return f"Data File {_table_label(df)}.\n\nSCHEMA:\n{schema_info}\n\nSAMPLE ROWS:\n{sample}"
+
 def handle_data_file(data_url):
-    global current_dataframe
     try:
         logger.info(f"Downloading Data file: {data_url}")
-        
-        if data_url.lower().endswith('.sql'):
-            return extract_text_file(data_url)
-
-        if data_url.lower().endswith('.json'):
-            try:
-                current_dataframe = pd.read_json(data_url)
-            except ValueError:
-                logger.info("JSON is not tabular. Reading as plain text.")
-                return extract_text_file(data_url)
-                
-        elif data_url.lower().endswith('.tsv'):
-            current_dataframe = pd.read_csv(data_url, sep='\t')
-        else:
-            current_dataframe = pd.read_csv(data_url)
-            try:
-                if len(current_dataframe.columns) > 0:
-                    float(current_dataframe.columns[0]) 
-                    logger.info("Numeric header detected. Reloading with header=None.")
-                    current_dataframe = pd.read_csv(data_url, header=None)
-                    current_dataframe.columns = [f"col_{i}" for i in range(len(current_dataframe.columns))]
-            except:
-                pass
-            
-        current_dataframe.columns = current_dataframe.columns.astype(str)
-        
-        buffer = io.StringIO()
-        current_dataframe.info(buf=buffer)
-        schema_info = buffer.getvalue()
-        sample = current_dataframe.head(3).to_markdown()
-        
-        return f"Data File Loaded into DataFrame 'df'.\n\nSCHEMA:\n{schema_info}\n\nSAMPLE ROWS:\n{sample}"
+        # Parsed from the on-disk cache; a large CSV is never held whole in memory
+        with download_cache.fetch_file(data_url) as f:
+            return data_file_from_bytes(f, data_url)
     except Exception as e:
         logger.error(f"Data load error: {e}")
         return extract_text_file(data_url)
 
-def scrape_page_and_links(url):
+async def _fetch_sub_page(context, link):
+    """Plain GET first; only pages that need JavaScript are opened in the browser."""
+    with span("sub_page_http"):
+        text = await asyncio.to_thread(fetch_static_text, link)
+    if text is not None:
+        return text
+    logger.info(f"🌐 {link} needs a browser")
+    with span("sub_page_browser"):
+        async with browser_manager.new_page(context) as sub_page:
+            await sub_page.goto(link, timeout=30000)
+            try: await sub_page.wait_for_load_state("domcontentloaded", timeout=5000)
+            except: pass
+            sub_content = await sub_page.content()
+    sub_soup = BeautifulSoup(sub_content, "html.parser")
+    return sub_soup.get_text(separator=" ", strip=True)[:3000]
+
+_extract_pool = ThreadPoolExecutor(max_workers=EXTRACT_WORKERS, thread_name_prefix="extract")
+
+async def _run_extractor(fn, link, tables=None):
+    """
+    Runs a blocking download/extractor on the extract pool, not the browser
+    loop's default executor. With `tables`, DataFrames it loads are collected
+    there instead of becoming `df`, so work that outlives the scrape budget
+    can't replace `df` later.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    if tables is None:
+        return await loop.run_in_executor(_extract_pool, ctx.run, fn, link)
+    return await loop.run_in_executor(_extract_pool, ctx.run, _collect_tables, tables, fn, link)
+
+async def _gather_in_order(jobs, deadline):
+    """
+    Runs (kind, link, coroutine) jobs concurrently and returns their results
+    in the original order. Anything still running at the deadline is
+    cancelled and its result is None.
+    """
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(MAX_PARALLEL_FETCHES)
+
+    async def _bounded(coro):
+        async with slots:
+            return await coro
+
+    tasks = [asyncio.ensure_future(_bounded(coro)) for _, _, coro in jobs]
+    if not tasks: return []
+
+    done, pending = await asyncio.wait(tasks, timeout=max(0, deadline - loop.time()))
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.wait(pending)
+
+    results = []
+    for (kind, link, _), task in zip(jobs, tasks):
+        if task in pending:
+            logger.warning(f"⏱️ Dropped {kind} (scrape budget exceeded): {link}")
+            results.append(None)
+        elif task.exception():
+            logger.error(f"Fetch failed for {link}: {task.exception()}")
+            results.append(None)
+        else:
+            results.append(task.result())
+    return results
+
+def scrape_page_and_links(url, time_budget=SCRAPE_BUDGET):
+    return browser_manager.run(_scrape_page_and_links(url, time_budget))
+
+async def _scrape_page_and_links(url, time_budget=SCRAPE_BUDGET):
     logger.info(f"Scraping URL: {url}")
     context_data = ""
     links_found = []
     collected_images_b64 = [] 
+    image_deduper = ImageDeduper()
+
+    if url.endswith(EXT_PDF): return (_label_tables(f"=== PDF CONTENT ===\n{await _run_extractor(extract_pdf_text, url)}"), [])
+    if url.endswith(EXT_DATA): return (_label_tables(f"=== DATA CONTENT ===\n{await _run_extractor(handle_data_file, url)}"), [])
+
+    try:
+        async with browser_manager.new_context() as context:
+            # The budget starts once we hold a context; queueing for one (behind
+            # other chains and prefetches) must not eat the attachments' time
+            remaining = http_client.time_left()
+            budget = time_budget if remaining is None else max(0, min(time_budget, remaining))
+            deadline = asyncio.get_running_loop().time() + budget
+            async with browser_manager.new_page(context) as page:
+                with span("goto"):
+                    await page.goto(url, timeout=60000, wait_until="domcontentloaded")
+                    # Most quiz pages render from inline scripts; don't stall on stray requests
+                    try: await page.wait_for_load_state("networkidle", timeout=NETWORK_IDLE_TIMEOUT)
+                    except: pass
+                    content_html = await page.content()
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context()
-        page = context.new_page()
-        
-        try:
-            if url.endswith(EXT_PDF): return (f"=== PDF CONTENT ===\n{extract_pdf_text(url)}", [])
-            if url.endswith(EXT_DATA): return (f"=== DATA CONTENT ===\n{handle_data_file(url)}", [])
-            
-            page.goto(url, timeout=60000)
-            page.wait_for_load_state("networkidle")
-            
             # --- SCREENSHOT REMOVED ---
             
-            content_html = page.content()
             soup = BeautifulSoup(content_html, "html.parser")
+
+            # Every fetch below is queued as (kind, link, coroutine) and run
+            # concurrently; results are stitched back together in this order.
+            jobs = []
+            image_candidates = 0
+            job_tables = {}  # job index -> DataFrames it loaded
+
+            def extract(fn, link):
+                return _run_extractor(fn, link, job_tables.setdefault(len(jobs), []))
             
             # --- DOWNLOAD <img> TAGS ---
             img_tags = soup.find_all('img')
@@ -219,11 +514,9 @@ def scrape_page_and_links(url):
                     full_img_url = urljoin(url, src)
                     if full_img_url not in links_found:
                         links_found.append(full_img_url)
-                        if len(collected_images_b64) < 3: # Limit to 3 images
-                            b64 = download_image_as_base64(full_img_url)
-                            if b64:
-                                collected_images_b64.append(b64)
-                                logger.info(f"🖼️ Downloaded and attached image: {full_img_url}")
+                        if image_candidates < MAX_IMAGE_CANDIDATES:
+                            image_candidates += 1
+                            jobs.append(("image", full_img_url, extract(download_image, full_img_url)))
 
             for script in soup(["script", "style"]):
                 script.decompose()
@@ -243,100 +536,104 @@ def scrape_page_and_links(url):
                 if lower_link.endswith(EXT_IMAGE):
                     if full_link not in links_found:
                         links_found.append(full_link)
-                        if len(collected_images_b64) < 3:
-                            b64 = download_image_as_base64(full_link)
-                            if b64:
-                                collected_images_b64.append(b64)
-                                context_data += f"\n[Attached Linked Image: {full_link}]\n"
+                        if image_candidates < MAX_IMAGE_CANDIDATES:
+                            image_candidates += 1
+                            jobs.append(("linked_image", full_link, extract(download_image, full_link)))
 
                 elif lower_link.endswith(EXT_AUDIO) or lower_link.endswith(EXT_VIDEO):
                     if full_link not in links_found:
                         links_found.append(full_link)
-                        context_data += f"=== MEDIA TRANSCRIPT ({full_link}) ===\n{transcribe_media(full_link)}\n\n"
+                        jobs.append(("MEDIA TRANSCRIPT", full_link, extract(transcribe_media, full_link)))
                 elif lower_link.endswith(EXT_PDF):
                     if full_link not in links_found:
                         links_found.append(full_link)
-                        context_data += f"=== PDF CONTENT ({full_link}) ===\n{extract_pdf_text(full_link)}\n\n"
+                        jobs.append(("PDF CONTENT", full_link, extract(extract_pdf_text, full_link)))
                 elif lower_link.endswith(EXT_DATA):
                     if full_link not in links_found:
                         links_found.append(full_link)
-                        context_data += f"=== DATA FILE ({full_link}) ===\n{handle_data_file(full_link)}\n\n"
+                        jobs.append(("DATA FILE", full_link, extract(handle_data_file, full_link)))
                 elif lower_link.endswith(EXT_TEXT):
                      if full_link not in links_found:
                         links_found.append(full_link)
-                        context_data += f"=== TEXT CONTENT ({full_link}) ===\n{extract_text_file(full_link)}\n\n"
+                        jobs.append(("TEXT CONTENT", full_link, extract(extract_text_file, full_link)))
                 elif lower_link.endswith(EXT_ARCHIVE):
                      if full_link not in links_found:
                         links_found.append(full_link)
-                        context_data += f"=== ZIP ARCHIVE CONTENT ({full_link}) ===\n{handle_zip_file(full_link)}\n\n"
+                        jobs.append(("ZIP ARCHIVE CONTENT", full_link, extract(handle_zip_file, full_link)))
                 elif tag.name == 'a' and full_link.startswith("http") and full_link not in links_found:
                     if lower_link.endswith(('.exe', '.rar', '.7z')): continue
                     if len(links_found) < 8: 
                         links_found.append(full_link)
-                        try:
-                            sub_page = context.new_page()
-                            sub_page.goto(full_link, timeout=30000)
-                            try: sub_page.wait_for_load_state("domcontentloaded", timeout=5000)
-                            except: pass
-                            sub_content = sub_page.content()
-                            sub_soup = BeautifulSoup(sub_content, "html.parser")
-                            sub_text = sub_soup.get_text(separator=" ", strip=True)[:3000]
-                            context_data += f"=== LINKED PAGE CONTENT ({full_link}) ===\n{sub_text}\n\n"
-                            sub_page.close()
-                        except: pass
+                        jobs.append(("LINKED PAGE CONTENT", full_link, _fetch_sub_page(context, full_link)))
+
+            results = await _gather_in_order(jobs, deadline)
+            # Jobs dropped at the deadline don't get to set df, even if their thread finishes later
+            _adopt_tables([table for i, result in enumerate(results) if result is not None
+                           for table in job_tables.get(i, [])])
+
+        for (kind, link, _), result in zip(jobs, results):
+            if result is None: continue
+            if kind in ("image", "linked_image"):
+                if len(collected_images_b64) >= MAX_IMAGES: continue
+                if not image_deduper.add(result):
+                    logger.info(f"🖼️ Skipped duplicate image: {link}")
+                    continue
+                collected_images_b64.append(result.data_url)
+                if kind == "image":
+                    logger.info(f"🖼️ Downloaded and attached image: {link}")
+                else:
+                    context_data += f"\n[Attached Linked Image: {link}]\n"
+            else:
+                if kind == "ZIP ARCHIVE CONTENT":
+                    result, zip_images = result
+                    for image in zip_images:
+                        if len(collected_images_b64) >= MAX_IMAGES: break
+                        if not image_deduper.add(image): continue
+                        collected_images_b64.append(image.data_url)
+                        context_data += f"\n[Attached Image from archive: {link}]\n"
+                context_data += f"=== {kind} ({link}) ===\n{result}\n\n"
                             
-        except Exception as e:
-            logger.error(f"Playwright error: {e}")
-            context_data += f"Error scraping {url}: {e}"
-        finally:
-            browser.close()
+    except Exception as e:
+        logger.error(f"Playwright error: {e}")
+        context_data += f"Error scraping {url}: {e}"
 
-    return context_data, collected_images_b64
+    return _label_tables(context_data), collected_images_b64
 
-def solve_single_question(current_url, email, secret):
-    global current_dataframe
-    logger.info(f"--- STARTING QUESTION: {current_url} ---")
-    current_dataframe = None
-    start_time = time.time()
-    MAX_TIME = 170
-    
-    page_context, images_b64 = scrape_page_and_links(current_url)
-    
-    attempt_history = ""
-    last_next_url_seen = None
+def _compute_with_code(prompt_context, history):
+    """Code path: asks the LLM for a pandas expression and evaluates it on df."""
+    logger.info("Data file detected. Asking LLM for Python code...")
+    code_prompt = f"""
+    You have a Pandas DataFrame named `df`.
+    Cols are STRINGS.
+    CONTEXT: {prompt_context}
+    PREVIOUS FAILED ATTEMPTS: {history}
+    TASK: Write a SINGLE Python expression to answer the question.
+    Return ONLY the code.
+    """
+    llm_code = get_llm_response(code_prompt)
+    if not llm_code:
+        return None
+    llm_code = llm_code.replace("```python", "").replace("```", "").strip()
+    logger.info(f"Executing Code: {llm_code}")
+    try:
+        # Runs in a warm worker process under CPU/memory limits
+        with span("sandbox"):
+            calculated_answer = sandbox_pool.run(llm_code, current_question().dataframe)
+        logger.info(f"Calculated Answer: {calculated_answer}")
+        return calculated_answer
+    except Exception as e:
+        return f"Error calculating: {e}"
 
-    while (time.time() - start_time) < MAX_TIME:
-        calculated_answer = None
-        if current_dataframe is not None:
-            logger.info("Data file detected. Asking LLM for Python code...")
-            code_prompt = f"""
-            You have a Pandas DataFrame named `df`.
-            Cols are STRINGS.
-            CONTEXT: {page_context}
-            PREVIOUS FAILED ATTEMPTS: {attempt_history}
-            TASK: Write a SINGLE Python expression to answer the question.
-            Return ONLY the code.
-            """
-            llm_code = get_llm_response(code_prompt)
-            if llm_code:
-                llm_code = llm_code.replace("```python", "").replace("```", "").strip()
-                logger.info(f"Executing Code: {llm_code}")
-                try:
-                    result = eval(llm_code, {"df": current_dataframe, "pd": pd})
-                    calculated_answer = str(result)
-                    logger.info(f"Calculated Answer: {calculated_answer}")
-                except Exception as e:
-                    calculated_answer = f"Error calculating: {e}"
-
-        system_prompt = "You are an AI agent. Identify the correct submission URL and answer."
-        user_prompt = f"""
-        PAGE CONTEXT: {page_context}
-        PREVIOUS ATTEMPTS: {attempt_history}
+def _submission_prompt(prompt_context, history, calculated_answer=None):
+    system_prompt = "You are an AI agent. Identify the correct submission URL and answer."
+    user_prompt = f"""
+        PAGE CONTEXT: {prompt_context}
+        PREVIOUS ATTEMPTS: {history}
         """
-        if calculated_answer:
-            user_prompt += f"\n\n*** PROGRAMMATIC ANSWER: {calculated_answer} ***\n*** USE THIS VALUE. ***"
-        
-        user_prompt += """
+    if calculated_answer:
+        user_prompt += f"\n\n*** PROGRAMMATIC ANSWER: {calculated_answer} ***\n*** USE THIS VALUE. ***"
+    
+    user_prompt += """
         INSTRUCTIONS:
         1. Find submit URL.
         2. Output JSON with "submit_url" and "answer".
@@ -346,15 +643,149 @@ def solve_single_question(current_url, email, secret):
         - Example for code: { "answer": "<div class=\\"test\\">Hello</div>" }
         - If images are attached, use them to answer visual questions.
         """
+    return system_prompt + "\n" + user_prompt
+
+def _request_submission(prompt_text, images_b64):
+    """
+    Returns the LLM's submission JSON as a dict, {} if it wasn't valid JSON,
+    or None if the API call failed.
+    """
+    if RACE_MODELS:
+        return race_llm_json(prompt_text, images_b64)
+    if LLM_STREAMING:
+        # Already parsed; returned as soon as submit_url and answer are complete
+        return stream_llm_json(prompt_text, images_b64)
+
+    llm_out = get_llm_response(prompt_text, images_b64)
+    if llm_out is None:
+        return None
+    clean_out = llm_out.replace("```json", "").replace("```", "").strip()
+    try:
+        data = json.loads(clean_out)
+        return data if isinstance(data, dict) else {}
+    except ValueError:
+        logger.warning(f"LLM output is not valid JSON: {clean_out[:200]}")
+        return {}
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _merge_computed_answer(submission_data, calculated_answer):
+    """
+    Folds the code path's value into a speculative direct answer. Returns the
+    submission to use, or None when the LLM has to be asked again with the
+    computed value. Only a whole number replaces a direct whole-number answer;
+    anything else (formatting, rounding, a value that isn't a count) goes back
+    to the LLM with the computed value.
+    """
+    if not calculated_answer or calculated_answer.startswith("Error calculating"):
+        return submission_data
+    if not submission_data or not submission_data.get("submit_url"):
+        return None
+
+    answer = submission_data.get("answer")
+    if str(answer).strip() == calculated_answer.strip():
+        return submission_data
+    try:
+        computed = json.loads(calculated_answer)
+        if _is_number(computed) and _is_number(answer):
+            if float(answer) == float(computed):
+                return submission_data
+            if isinstance(answer, int) and float(computed).is_integer():
+                logger.info(f"Computed value {computed} replaces direct answer {answer!r}.")
+                return {**submission_data, "answer": int(computed)}
+    except ValueError:
+        pass
+    return None
+
+def solve_single_question(current_url, email, secret, prefetcher=None):
+    start_time = time.time()
+    prefetch = prefetcher.take(current_url) if prefetcher is not None else None
+    state = prefetch.state if prefetch is not None else QuestionState(current_url)
+    job = current_job()
+    if job is not None: job.add_question(state)
 
-        llm_out = get_llm_response(system_prompt + "\n" + user_prompt, images_b64)
-        if not llm_out:
-            time.sleep(2)
+    token = set_current_question(state)
+    question_trace = None
+    try:
+        # Every outbound request (and its retries) is bounded by the question deadline
+        with http_client.deadline(start_time + MAX_TIME), trace("question", url=current_url) as question_trace:
+            with span("question"):
+                next_url = _solve_single_question(current_url, email, secret, start_time, state, prefetch, prefetcher)
+        if state.status != "correct": state.finish("timed_out", next_url)
+        return next_url
+    except Exception:
+        state.finish("failed")
+        raise
+    finally:
+        reset_current_question(token)
+        questions_total.inc(status=state.status)
+        if question_trace is not None:
+            question_trace.attrs.update(status=state.status, attempts=state.attempts)
+            if prefetch is not None and prefetch.trace is not None:
+                question_trace.attrs["prefetch"] = prefetch.trace.to_dict()
+            job_id = job.id if job is not None else "nojob"
+            state.trace_file = question_trace.save(f"{job_id}_{int(start_time * 1000)}.json")
+
+def _solve_single_question(current_url, email, secret, start_time, state, prefetch=None, prefetcher=None):
+    logger.info(f"--- STARTING QUESTION: {current_url} ---")
+    scheduler = QuestionScheduler(MAX_TIME, start_time)
+
+    scraped = None
+    if prefetch is not None:
+        # Not scheduler.measure: a wait on a half-done scrape would skew the scrape estimate
+        with span("prefetch_wait"):
+            scraped = prefetch.result()
+        if scraped is not None:
+            logger.info(f"🔮 Using prefetched context for {current_url}")
+    if scraped is None:
+        with scheduler.measure("scrape"):
+            scraped = scrape_page_and_links(current_url)
+    state.page_context, images_b64 = scraped
+    # Ranked and packed under the token budget once; retries reuse it
+    prompt_context = build_context(state.page_context)
+    state.status = "answering"
+    
+    last_next_url_seen = None
+
+    # Below MIN_ATTEMPT_TIME every request fails with DeadlineExceeded straight away
+    while scheduler.remaining() > http_client.MIN_ATTEMPT_TIME:
+        action = scheduler.next_action(last_next_url_seen is not None)
+        if action == QuestionScheduler.MOVE_ON:
+            break
+        if action == QuestionScheduler.RESCRAPE:
+            scheduler.on_rescrape()
+            with scheduler.measure("scrape"):
+                state.page_context, images_b64 = scrape_page_and_links(current_url, scheduler.scrape_budget(SCRAPE_BUDGET))
+            prompt_context = build_context(state.page_context)
+
+        history = trim_history(state.attempt_history)
+        state.attempts += 1
+
+        with scheduler.measure("answer"):
+            if state.dataframe is not None and SPECULATIVE_ANSWER:
+                # Ask for the direct answer while the code path is still running
+                code_future = submit_llm_task(_compute_with_code, prompt_context, history)
+                submission_data = _request_submission(_submission_prompt(prompt_context, history), images_b64)
+                calculated_answer = code_future.result()
+                merged = _merge_computed_answer(submission_data, calculated_answer)
+                if merged is None:
+                    logger.info("Computed value changes the answer. Asking again with it...")
+                    merged = _request_submission(_submission_prompt(prompt_context, history, calculated_answer), images_b64)
+                submission_data = merged
+            else:
+                calculated_answer = None
+                if state.dataframe is not None:
+                    calculated_answer = _compute_with_code(prompt_context, history)
+                submission_data = _request_submission(_submission_prompt(prompt_context, history, calculated_answer), images_b64)
+
+        if submission_data is None:
+            attempts_total.inc(outcome="glitch")
+            scheduler.on_glitch()
+            scheduler.sleep(scheduler.wait_after_glitch())
             continue
 
         try:
-            clean_out = llm_out.replace("```json", "").replace("```", "").strip()
-            submission_data = json.loads(clean_out)
             submit_url = submission_data.get("submit_url")
             answer = submission_data.get("answer")
             
@@ -363,34 +794,56 @@ def solve_single_question(current_url, email, secret):
             payload = {"email": email, "secret": secret, "url": current_url, "answer": answer}
             logger.info(f"Submitting to {submit_url} with payload: {payload}")
             
-            post_resp = requests.post(submit_url, json=payload, timeout=10)
-            resp_json = post_resp.json()
+            with scheduler.measure("submit"):
+                # Never retried: a timed-out POST may still have been recorded as an attempt
+                post_resp = http_client.post(submit_url, json=payload, timeout=10, retries=0)
+                resp_json = post_resp.json()
             logger.info(f"Submission Response: {resp_json}")
 
             if resp_json.get("correct") is True:
+                attempts_total.inc(outcome="correct")
                 logger.info("Answer Correct!")
+                state.finish("correct", resp_json.get("url"))
                 return resp_json.get("url") 
             else:
+                attempts_total.inc(outcome="wrong")
                 reason = resp_json.get("reason", "Unknown error")
-                attempt_history += f"\nAttempt '{answer}' failed: {reason}."
-                if resp_json.get("url"): last_next_url_seen = resp_json.get("url")
-                logger.info("Waiting 10 seconds before retrying...")
-                time.sleep(10)
+                state.attempt_history += f"\nAttempt '{answer}' failed: {reason}."
+                if resp_json.get("url"):
+                    last_next_url_seen = resp_json.get("url")
+                    # Scrape it while we keep retrying this one
+                    if prefetcher is not None: prefetcher.start(last_next_url_seen)
+                scheduler.on_wrong_answer()
+                delay = scheduler.wait_after_wrong()
+                logger.info(f"Waiting {delay:.1f}s before retrying ({scheduler.remaining():.0f}s left)...")
+                scheduler.sleep(delay)
         except Exception as e:
             logger.warning(f"LLM/Network glitch (Retrying): {e}")
-            attempt_history += f"\nError: {str(e)}"
-            time.sleep(2)
+            attempts_total.inc(outcome="glitch")
+            state.attempt_history += f"\nError: {str(e)}"
+            scheduler.on_glitch()
+            scheduler.sleep(scheduler.wait_after_glitch())
 
     return last_next_url_seen if last_next_url_seen else None
 
 def run_quiz_chain(email, secret, start_url):
+    with span("quiz_chain"):
+        _run_quiz_chain(email, secret, start_url)
+
+def _run_quiz_chain(email, secret, start_url):
+    # Next URLs seen in wrong-answer responses are scraped in the background and
+    # handed over if the chain advances to them
+    prefetcher = ChainPrefetcher(scrape_page_and_links, MAX_TIME)
     current_url = start_url
-    while current_url:
-        logger.info(f"=== Starting Chain Link: {current_url} ===")
-        next_url = solve_single_question(current_url, email, secret)
-        if next_url: current_url = next_url
-        else:
-            logger.info("_________________________________________________")
-            logger.info("   🎉 QUIZ COMPLETED SUCCESSFULLY! 🎉")
-            logger.info("_________________________________________________")
-            break
+    try:
+        while current_url:
+            logger.info(f"=== Starting Chain Link: {current_url} ===")
+            next_url = solve_single_question(current_url, email, secret, prefetcher)
+            if next_url: current_url = next_url
+            else:
+                logger.info("_________________________________________________")
+                logger.info("   🎉 QUIZ COMPLETED SUCCESSFULLY! 🎉")
+                logger.info("_________________________________________________")
+                break
+    finally:
+        prefetcher.discard()